@@ -0,0 +1,306 @@
+"""
+Banco de pruebas de rendimiento.
+
+Genera archivos de entrada sintéticos y mide cada etapa del programa por
+separado (carga, patrones, agrupamiento, salida y gráficas), reportando
+tiempo, throughput y memoria pico en JSON.
+
+    python Benchmark.py --campos 2 --estaciones 2000 --sensores-suelo 50 \
+        --sensores-cultivo 30 --densidad 0.1 --duplicacion 0.6 --salida reporte.json
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from xml.sax.saxutils import quoteattr
+
+
+def generar_archivo_sintetico(ruta, campos=1, estaciones=100, sensores_suelo=10,
+                              sensores_cultivo=10, densidad=0.2, duplicacion=0.5, semilla=0):
+    """
+    Escribe un archivo de entrada sintético.
+
+    densidad: probabilidad de que un sensor tenga frecuencia para una estación.
+    duplicacion: probabilidad de que una estación copie el patrón de otra ya
+    generada (controla cuántas estaciones terminan agrupadas).
+    Devuelve la cantidad de frecuencias escritas.
+    """
+    aleatorio = random.Random(semilla)
+    total_frecuencias = 0
+
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        archivo.write('<?xml version="1.0" encoding="UTF-8"?>\n<camposAgricolas>\n')
+        for numero_campo in range(campos):
+            campo_id = f"{numero_campo + 1:02d}"
+            archivo.write(f'    <campo id="{campo_id}" nombre={quoteattr("Campo agrícola " + campo_id)}>\n')
+
+            ids_estaciones = [f"e{numero + 1:05d}" for numero in range(estaciones)]
+            archivo.write('        <estacionesBase>\n')
+            for numero, id_estacion in enumerate(ids_estaciones):
+                archivo.write(f'            <estacion id="{id_estacion}" nombre="Estacion {numero + 1}"/>\n')
+            archivo.write('        </estacionesBase>\n')
+
+            # Patrón de cada estación: conjuntos de sensores activos
+            patrones = []
+            for _ in ids_estaciones:
+                if patrones and aleatorio.random() < duplicacion:
+                    patrones.append(aleatorio.choice(patrones))
+                else:
+                    patrones.append((
+                        frozenset(i for i in range(sensores_suelo) if aleatorio.random() < densidad),
+                        frozenset(i for i in range(sensores_cultivo) if aleatorio.random() < densidad),
+                    ))
+
+            for seccion, etiqueta, prefijo, cantidad, tipo in (
+                    ("sensoresSuelo", "sensorS", "s", sensores_suelo, 0),
+                    ("sensoresCultivo", "sensorT", "t", sensores_cultivo, 1)):
+                archivo.write(f'        <{seccion}>\n')
+                for numero_sensor in range(cantidad):
+                    archivo.write(f'            <{etiqueta} id="{prefijo}{numero_sensor + 1:04d}" '
+                                  f'nombre="Sensor {prefijo.upper()}{numero_sensor + 1:04d}">\n')
+                    for id_estacion, patron in zip(ids_estaciones, patrones):
+                        if numero_sensor in patron[tipo]:
+                            valor = aleatorio.randint(1, 5000)
+                            archivo.write(f'                <frecuencia idEstacion="{id_estacion}">{valor}</frecuencia>\n')
+                            total_frecuencias += 1
+                    archivo.write(f'            </{etiqueta}>\n')
+                archivo.write(f'        </{seccion}>\n')
+
+            archivo.write('    </campo>\n')
+        archivo.write('</camposAgricolas>\n')
+
+    return total_frecuencias
+
+
+def medir(funcion, medir_memoria=True):
+    """
+    Ejecuta funcion() silenciando sus mensajes. El tiempo se toma sin
+    tracemalloc (que distorsiona) y la memoria pico en una segunda corrida.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        inicio_cpu = time.process_time()
+        resultado = funcion()
+        segundos = time.perf_counter() - inicio
+        segundos_cpu = time.process_time() - inicio_cpu
+
+        pico = None
+        if medir_memoria:
+            tracemalloc.start()
+            funcion()
+            pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    return resultado, {"segundos": segundos, "segundos_cpu": segundos_cpu, "memoria_pico_bytes": pico}
+
+
+def _tamano_objeto(objeto):
+    """Bytes de la instancia más su diccionario de atributos, si lo tiene"""
+    tamano = sys.getsizeof(objeto)
+    atributos = getattr(objeto, "__dict__", None)
+    if atributos is not None:
+        tamano += sys.getsizeof(atributos)
+    return tamano
+
+
+def medir_memoria_carga(ruta_entrada):
+    """
+    Memoria que queda ocupada por los campos cargados, en total y por
+    frecuencia, junto con el tamaño de una instancia de cada entidad.
+    """
+    from Principal import cargar_xml
+    from EstructuraBase import Nodo
+    from Entidades import Frecuencia, Estacion, SensorSuelo
+
+    gc.collect()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        campos = cargar_xml(ruta_entrada)
+    gc.collect()
+    retenida = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    total_frecuencias = sum(len(sensor.frecuencias)
+                            for campo in campos
+                            for sensores in (campo.sensores_suelo, campo.sensores_cultivo)
+                            for sensor in sensores)
+    columnas = SensorSuelo("", "").frecuencias
+    return {
+        "memoria_retenida_bytes": retenida,
+        "frecuencias": total_frecuencias,
+        "bytes_por_frecuencia": retenida / total_frecuencias if total_frecuencias else None,
+        "bytes_por_objeto": {
+            "Nodo": _tamano_objeto(Nodo(None)),
+            "Frecuencia": _tamano_objeto(Frecuencia("", 0)),
+            "Estacion": _tamano_objeto(Estacion("", "")),
+            "Sensor": _tamano_objeto(SensorSuelo("", "")),
+            "lectura_en_columnas": columnas.estaciones.itemsize + columnas.valores.itemsize,
+        },
+    }
+
+
+def comparar_lectores(ruta_entrada, lectores=("etree", "expat"), total_frecuencias=None,
+                      medir_memoria=True):
+    """Tiempo y memoria pico de cargar el archivo con cada lector de XML"""
+    from CargarProcesarSalidaDatos import cargar_campos
+
+    resultados = {}
+    for lector in lectores:
+        campos, medicion = medir(lambda: cargar_campos(ruta_entrada, lector=lector), medir_memoria)
+        if total_frecuencias is None:
+            total_frecuencias = sum(len(sensor.frecuencias)
+                                    for campo in campos
+                                    for sensores in (campo.sensores_suelo, campo.sensores_cultivo)
+                                    for sensor in sensores)
+        resultados[lector] = _throughput(medicion, total_frecuencias, "frecuencias")
+        del campos
+    return resultados
+
+
+def _throughput(medicion, unidades, nombre_unidad):
+    medicion["unidades"] = unidades
+    medicion["unidad"] = nombre_unidad
+    medicion["por_segundo"] = unidades / medicion["segundos"] if medicion["segundos"] > 0 else None
+    return medicion
+
+
+def ejecutar_benchmark(ruta_entrada, total_frecuencias=None, motores=("directa", "hash"),
+                       graficas=True, medir_memoria=True, lectores=("etree", "expat")):
+    """Mide cada etapa sobre un archivo de entrada y devuelve el reporte como diccionario"""
+    from Principal import cargar_xml
+    from CargarProcesarSalidaDatos import (calcular_patrones_estaciones, agrupar_estaciones,
+                                           calcular_frecuencias_reducidas, generar_xml_salida)
+
+    reporte = {"entrada": ruta_entrada, "tamano_bytes": os.path.getsize(ruta_entrada),
+               "etapas": {}, "campos": []}
+
+    campos, medicion = medir(lambda: cargar_xml(ruta_entrada), medir_memoria)
+    if campos is None:
+        raise RuntimeError(f"No se pudo cargar {ruta_entrada}")
+    if total_frecuencias is None:
+        total_frecuencias = sum(len(sensor.frecuencias)
+                                for campo in campos
+                                for sensores in (campo.sensores_suelo, campo.sensores_cultivo)
+                                for sensor in sensores)
+    reporte["etapas"]["cargar_xml"] = _throughput(medicion, total_frecuencias, "frecuencias")
+    if medir_memoria:
+        reporte["memoria_carga"] = medir_memoria_carga(ruta_entrada)
+    if lectores:
+        reporte["lectores_xml"] = comparar_lectores(ruta_entrada, lectores, total_frecuencias,
+                                                    medir_memoria)
+
+    graficadora = None
+    if graficas:
+        try:
+            from GraficaDatos import GraficadoraDatos
+            graficadora = GraficadoraDatos()
+        except ImportError:
+            reporte["graficas"] = "omitidas: graphviz no está instalado"
+
+    for campo in campos:
+        num_estaciones = len(campo.estaciones)
+        datos_campo = {"id": campo.id, "estaciones": num_estaciones,
+                       "sensores_suelo": len(campo.sensores_suelo),
+                       "sensores_cultivo": len(campo.sensores_cultivo), "etapas": {}}
+        etapas = datos_campo["etapas"]
+
+        _, medicion = medir(lambda: calcular_patrones_estaciones(campo), medir_memoria)
+        etapas["calcular_patrones_estaciones"] = _throughput(medicion, num_estaciones, "estaciones")
+
+        for motor in motores:
+            nombre = ("agrupar_estaciones_comparacion_directa" if motor == "directa"
+                      else f"agrupar_estaciones_{motor}")
+            grupos, medicion = medir(lambda: agrupar_estaciones(campo, motor), medir_memoria)
+            etapas[nombre] = _throughput(medicion, num_estaciones, "estaciones")
+            if motor == "hash":
+                grupos_hash = grupos
+        # Las etapas siguientes y la escritura usan siempre los grupos de "hash":
+        # así su costo no depende de qué motores se midieron ni en qué orden
+        campo.grupos_estaciones = grupos_hash if "hash" in motores else agrupar_estaciones(campo, "hash")
+        datos_campo["grupos"] = len(campo.grupos_estaciones)
+
+        _, medicion = medir(lambda: calcular_frecuencias_reducidas(campo), medir_memoria)
+        etapas["calcular_frecuencias_reducidas"] = _throughput(medicion, datos_campo["grupos"], "grupos")
+
+        if graficadora is not None:
+            for tipo in ("frecuencias", "patrones", "reducida"):
+                # Solo se arma el DOT; el render depende del binario de Graphviz
+                _, medicion = medir(lambda: graficadora.construir_dots(campo, tipo), medir_memoria)
+                etapas[f"graficar_matriz_{tipo}"] = _throughput(medicion, num_estaciones, "estaciones")
+
+        reporte["campos"].append(datos_campo)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta_salida = os.path.join(directorio, "salida.xml")
+        _, medicion = medir(lambda: generar_xml_salida(campos, ruta_salida), medir_memoria)
+        reporte["etapas"]["generar_xml_salida"] = _throughput(
+            medicion, sum(campo["grupos"] for campo in reporte["campos"]), "grupos")
+
+    try:
+        import resource
+        # ru_maxrss está en KiB en Linux
+        reporte["rss_maximo_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        pass
+
+    return reporte
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Benchmark de etapas del procesamiento")
+    parser.add_argument("--entrada", help="archivo existente a medir (si no, se genera uno sintético)")
+    parser.add_argument("--campos", type=int, default=1)
+    parser.add_argument("--estaciones", type=int, default=500)
+    parser.add_argument("--sensores-suelo", type=int, default=20)
+    parser.add_argument("--sensores-cultivo", type=int, default=20)
+    parser.add_argument("--densidad", type=float, default=0.2)
+    parser.add_argument("--duplicacion", type=float, default=0.5)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--motores", default="directa,hash",
+                        help="motores de agrupamiento a medir, separados por coma")
+    parser.add_argument("--lectores", default="etree,expat",
+                        help="lectores de XML a comparar en la carga, separados por coma")
+    parser.add_argument("--sin-graficas", action="store_true")
+    parser.add_argument("--sin-memoria", action="store_true",
+                        help="no medir memoria pico (evita la segunda corrida con tracemalloc)")
+    parser.add_argument("--salida", help="archivo JSON para el reporte (por defecto, stdout)")
+    opciones = parser.parse_args(argumentos)
+
+    with tempfile.TemporaryDirectory() as directorio:
+        total_frecuencias = None
+        parametros = None
+        ruta_entrada = opciones.entrada
+        if ruta_entrada is None:
+            ruta_entrada = os.path.join(directorio, "entrada_sintetica.xml")
+            parametros = {"campos": opciones.campos, "estaciones": opciones.estaciones,
+                          "sensores_suelo": opciones.sensores_suelo,
+                          "sensores_cultivo": opciones.sensores_cultivo,
+                          "densidad": opciones.densidad, "duplicacion": opciones.duplicacion,
+                          "semilla": opciones.semilla}
+            total_frecuencias = generar_archivo_sintetico(ruta_entrada, **parametros)
+
+        reporte = ejecutar_benchmark(ruta_entrada, total_frecuencias,
+                                     motores=[motor for motor in opciones.motores.split(",") if motor],
+                                     graficas=not opciones.sin_graficas,
+                                     medir_memoria=not opciones.sin_memoria,
+                                     lectores=[lector for lector in opciones.lectores.split(",") if lector])
+        reporte["parametros"] = parametros
+
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+    if opciones.salida:
+        with open(opciones.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto)
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+"""
+Mensajes de estado del procesamiento con niveles de detalle.
+
+El menú interactivo trabaja en DETALLE (muestra todo, como siempre); el modo
+por lotes arranca en NORMAL y puede bajarse a SILENCIO o subirse a DETALLE.
+Los errores se muestran en cualquier nivel y van a stderr.
+"""
+import sys
+
+SILENCIO = 0
+NORMAL = 1
+DETALLE = 2
+
+nivel_actual = DETALLE
+
+
+def establecer_nivel(nivel):
+    """Cambia el nivel de detalle de los mensajes"""
+    global nivel_actual
+    nivel_actual = max(SILENCIO, min(DETALLE, nivel))
+
+
+def detalle_activo():
+    """Permite saltarse por completo los bucles que solo existen para informar"""
+    return nivel_actual >= DETALLE
+
+
+def registrar(mensaje, nivel=NORMAL):
+    """Muestra el mensaje si el nivel actual lo permite"""
+    if nivel <= nivel_actual:
+        print(mensaje)
+
+
+def registrar_error(mensaje):
+    """Los errores se muestran siempre"""
+    print(mensaje, file=sys.stderr)
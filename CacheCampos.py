@@ -0,0 +1,263 @@
+"""
+Caché binario de los campos cargados, para no volver a parsear el XML.
+
+El snapshot se identifica por el hash SHA-256 del contenido del archivo de
+entrada y por la versión del esquema. Formato del archivo:
+
+    MAGIA (8 bytes) | versión (uint32) | largo de metadatos (uint64)
+    metadatos JSON (utf-8) | relleno hasta múltiplo de 8
+    arreglo int64 con los valores de los sensores de 64 bits
+    arreglo int32 con el índice de estación de cada frecuencia
+    arreglo int32 con los valores de los sensores de 32 bits
+    bytes de patrones empaquetados (solo si se guardó el procesamiento)
+
+Los índices de estación se refieren a la tabla de ids de cada campo, que se
+guarda en los metadatos. Al cargar, esa tabla pasa a ser la del campo y las
+columnas de cada sensor se copian directo desde el mmap, sin recorrerlas.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+
+from EstructuraBase import ListaEnlazada, Patron, TablaIds
+from Entidades import CampoAgricola, Estacion, SensorSuelo, SensorCultivo, GrupoEstaciones
+from Bitacora import registrar
+
+MAGIA = b"AGROCACH"
+VERSION_ESQUEMA = 2
+_CABECERA = struct.Struct("<8sIQ")
+
+
+def hash_archivo(ruta_archivo):
+    """SHA-256 del contenido del archivo, leído por bloques"""
+    huella = hashlib.sha256()
+    with open(ruta_archivo, "rb") as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b""):
+            huella.update(bloque)
+    return huella.hexdigest()
+
+
+def ruta_snapshot(ruta_entrada, directorio=None, huella=None):
+    """Ruta del snapshot para un archivo de entrada (por defecto en .cache_campos junto a él)"""
+    if directorio is None:
+        directorio = os.path.join(os.path.dirname(os.path.abspath(ruta_entrada)), ".cache_campos")
+    if huella is None:
+        huella = hash_archivo(ruta_entrada)
+    return os.path.join(directorio, f"{huella}.v{VERSION_ESQUEMA}.bin")
+
+
+def _bytes_patron(patron, ancho):
+    return patron.bits.to_bytes(ancho, "little")
+
+
+def guardar_snapshot(campos, ruta_entrada, directorio=None, incluir_procesamiento=False):
+    """
+    Guarda los campos en un snapshot binario. Con incluir_procesamiento=True
+    también se guardan los patrones y grupos (si los campos ya se procesaron).
+    Devuelve la ruta del snapshot.
+    """
+    valores_64 = array('q')
+    estaciones_frecuencia = array('i')
+    valores_32 = array('i')
+    patrones = bytearray()
+    metadatos = {"campos": []}
+
+    for campo in campos:
+        # Tabla de ids: primero las estaciones definidas, luego ids solo referenciados
+        tabla_ids = []
+        posicion_id = {}
+
+        def indice_id(id_estacion):
+            posicion = posicion_id.get(id_estacion)
+            if posicion is None:
+                posicion = len(tabla_ids)
+                posicion_id[id_estacion] = posicion
+                tabla_ids.append(id_estacion)
+            return posicion
+
+        estaciones = [[indice_id(estacion.id), estacion.nombre] for estacion in campo.estaciones]
+
+        datos_sensores = {}
+        for tipo, sensores in (("suelo", campo.sensores_suelo), ("cultivo", campo.sensores_cultivo)):
+            datos_sensores[tipo] = []
+            for sensor in sensores:
+                columnas = sensor.frecuencias
+                if not isinstance(columnas.valores, array):
+                    raise OverflowError(f"El sensor {sensor.id} tiene frecuencias que no caben en 64 bits")
+                ids = columnas.tabla_ids.ids
+                estaciones_frecuencia.extend(array('i', [indice_id(ids[indice])
+                                                         for indice in columnas.estaciones]))
+                ancho = 4 if columnas.valores_32_bits() else 8
+                (valores_32 if ancho == 4 else valores_64).extend(columnas.valores)
+                datos_sensores[tipo].append([sensor.id, sensor.nombre, len(columnas), ancho])
+
+        datos_campo = {"id": campo.id, "nombre": campo.nombre, "ids": tabla_ids,
+                       "estaciones": estaciones, "sensores_suelo": datos_sensores["suelo"],
+                       "sensores_cultivo": datos_sensores["cultivo"]}
+
+        procesado = (incluir_procesamiento and not campo.grupos_estaciones.esta_vacia() and
+                     all(estacion.patron_suelo is not None for estacion in campo.estaciones))
+        if procesado:
+            ancho_suelo = (len(campo.sensores_suelo) + 7) // 8
+            ancho_cultivo = (len(campo.sensores_cultivo) + 7) // 8
+            posiciones = {}
+            for posicion, estacion in enumerate(campo.estaciones):
+                posiciones[id(estacion)] = posicion
+                patrones += _bytes_patron(estacion.patron_suelo, ancho_suelo)
+                patrones += _bytes_patron(estacion.patron_cultivo, ancho_cultivo)
+            datos_campo["grupos"] = [[posiciones[id(estacion)] for estacion in grupo]
+                                     for grupo in campo.grupos_estaciones]
+
+        metadatos["campos"].append(datos_campo)
+
+    metadatos["total_frecuencias"] = len(estaciones_frecuencia)
+    metadatos["frecuencias_64"] = len(valores_64)
+    metadatos["bytes_patrones"] = len(patrones)
+    texto = json.dumps(metadatos, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    relleno = (-(_CABECERA.size + len(texto))) % 8
+
+    ruta = ruta_snapshot(ruta_entrada, directorio)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as archivo:
+        archivo.write(_CABECERA.pack(MAGIA, VERSION_ESQUEMA, len(texto)))
+        archivo.write(texto)
+        archivo.write(b"\0" * relleno)
+        valores_64.tofile(archivo)
+        estaciones_frecuencia.tofile(archivo)
+        valores_32.tofile(archivo)
+        archivo.write(patrones)
+    # Reemplazo atómico: nunca queda un snapshot a medio escribir
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def cargar_snapshot(ruta_entrada, directorio=None):
+    """Carga los campos desde el snapshot; None si no existe o no es de esta versión"""
+    ruta = ruta_snapshot(ruta_entrada, directorio)
+    if not os.path.exists(ruta):
+        return None
+
+    try:
+        with open(ruta, "rb") as archivo:
+            with mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                vista = memoryview(mapa)
+                try:
+                    return _leer_snapshot(vista)
+                finally:
+                    vista.release()
+    except (ValueError, KeyError, IndexError, TypeError, struct.error):
+        # Snapshot truncado o dañado: se trata como si no existiera
+        return None
+
+
+def _leer_snapshot(vista):
+    magia, version, largo = _CABECERA.unpack_from(vista, 0)
+    if magia != MAGIA or version != VERSION_ESQUEMA:
+        return None
+
+    inicio = _CABECERA.size
+    metadatos = json.loads(bytes(vista[inicio:inicio + largo]).decode("utf-8"))
+    inicio += largo + (-(inicio + largo)) % 8
+
+    total = metadatos["total_frecuencias"]
+    total_64 = metadatos["frecuencias_64"]
+    # Un archivo truncado (o con bytes de más) no se usa: cada sección debe estar completa
+    if len(vista) != inicio + 8 * total_64 + 4 * total + 4 * (total - total_64) + metadatos["bytes_patrones"]:
+        return None
+    # Secciones en bytes; cada sensor copia su tramo con frombytes (sin objetos por frecuencia)
+    secciones = {}
+    for nombre_seccion, largo_seccion in (("valores_64", 8 * total_64), ("estaciones", 4 * total),
+                                          ("valores_32", 4 * (total - total_64)),
+                                          ("patrones", metadatos["bytes_patrones"])):
+        secciones[nombre_seccion] = vista[inicio:inicio + largo_seccion]
+        inicio += largo_seccion
+
+    campos = ListaEnlazada()
+    # Bytes ya leídos de cada sección
+    posiciones = dict.fromkeys(("valores_64", "estaciones", "valores_32"), 0)
+    posicion_patron = 0
+
+    def leer_columna(nombre_seccion, tipo, cantidad):
+        columna = array(tipo)
+        inicio_columna = posiciones[nombre_seccion]
+        fin = inicio_columna + cantidad * columna.itemsize
+        columna.frombytes(secciones[nombre_seccion][inicio_columna:fin])
+        posiciones[nombre_seccion] = fin
+        if len(columna) != cantidad:
+            raise ValueError(f"Sección {nombre_seccion} incompleta en el snapshot")
+        return columna
+
+    try:
+        for datos in metadatos["campos"]:
+            campo = CampoAgricola(datos["id"], datos["nombre"])
+            # La tabla del snapshot es la del campo: los índices guardados valen tal cual
+            campo.tabla_ids = tabla_ids = TablaIds.desde_ids(datos["ids"])
+            for indice, nombre in datos["estaciones"]:
+                campo.agregar_estacion(Estacion(tabla_ids[indice], nombre))
+
+            for clase, clave, agregar in ((SensorSuelo, "sensores_suelo", campo.agregar_sensor_suelo),
+                                          (SensorCultivo, "sensores_cultivo", campo.agregar_sensor_cultivo)):
+                for sensor_id, sensor_nombre, cantidad, ancho in datos[clave]:
+                    sensor = clase(sensor_id, sensor_nombre, tabla_ids)
+                    estaciones = leer_columna("estaciones", 'i', cantidad)
+                    if ancho == 4:
+                        valores = leer_columna("valores_32", 'i', cantidad)
+                    else:
+                        valores = leer_columna("valores_64", 'q', cantidad)
+                    sensor.frecuencias.asignar_columnas(estaciones, valores)
+                    agregar(sensor)
+
+            if "grupos" in datos:
+                posicion_patron = _restaurar_procesamiento(campo, datos["grupos"], secciones["patrones"],
+                                                           posicion_patron)
+
+            campos.insertar(campo)
+    finally:
+        for seccion in secciones.values():
+            seccion.release()
+
+    return campos
+
+
+def _restaurar_procesamiento(campo, grupos, patrones, posicion):
+    from CargarProcesarSalidaDatos import calcular_frecuencias_reducidas
+
+    num_suelo = len(campo.sensores_suelo)
+    num_cultivo = len(campo.sensores_cultivo)
+    ancho_suelo = (num_suelo + 7) // 8
+    ancho_cultivo = (num_cultivo + 7) // 8
+
+    estaciones = campo.estaciones.recorrer()
+    for estacion in estaciones:
+        bits = int.from_bytes(patrones[posicion:posicion + ancho_suelo], "little")
+        estacion.patron_suelo = Patron.desde_bits(bits, num_suelo)
+        posicion += ancho_suelo
+        bits = int.from_bytes(patrones[posicion:posicion + ancho_cultivo], "little")
+        estacion.patron_cultivo = Patron.desde_bits(bits, num_cultivo)
+        posicion += ancho_cultivo
+
+    for posiciones in grupos:
+        campo.grupos_estaciones.insertar(GrupoEstaciones([estaciones[p] for p in posiciones]))
+    calcular_frecuencias_reducidas(campo)
+    return posicion
+
+
+def cargar_con_cache(ruta_entrada, directorio=None, lector="etree"):
+    """Usa el snapshot si existe; si no, parsea el XML (con lector) y deja el snapshot guardado"""
+    campos = cargar_snapshot(ruta_entrada, directorio)
+    if campos is not None:
+        registrar(f"➢ Campos cargados desde caché: {ruta_entrada}")
+        return campos
+
+    from CargarProcesarSalidaDatos import cargar_campos
+    campos = cargar_campos(ruta_entrada, lector=lector)
+    try:
+        guardar_snapshot(campos, ruta_entrada, directorio)
+    except OverflowError:
+        # El snapshot guarda los valores como int32 o int64
+        registrar("➢ No se guarda el snapshot: hay frecuencias que no caben en 64 bits")
+    return campos
@@ -1,6 +1,11 @@
+import os
+import sys
 import xml.etree.ElementTree as ET
+import Instrumentacion
 from EstructuraBase import ListaEnlazada, Patron
 from Entidades import CampoAgricola, Estacion, SensorSuelo, SensorCultivo, GrupoEstaciones
+from Bitacora import registrar, registrar_error, DETALLE
+
 
 def _lista_esta_vacia(lista_enlazada):
     """Verifica si una lista enlazada está vacía"""
@@ -17,26 +22,175 @@ def _obtener_elementos_lista(lista_enlazada):
     return elementos
 
 
+LECTORES_XML = ("etree", "expat")
+
+
+def _convertir_frecuencias(ids_estacion, textos, campo_id, sensor_id, reporte):
+    """
+    Listas paralelas (ids, valores) a partir de los textos de las <frecuencia>.
+    int() ya ignora los espacios alrededor del número, no hace falta strip().
+    """
+    try:
+        return ids_estacion, [int(texto) for texto in textos]
+    except (TypeError, ValueError):
+        if reporte is None:
+            raise
+
+    # Con validación, un valor que no es entero se reporta y se descarta
+    from ValidacionDatos import leer_valor_frecuencia
+    ids_validos = []
+    valores = []
+    for id_estacion, texto in zip(ids_estacion, textos):
+        valor = leer_valor_frecuencia(texto, reporte, campo_id, sensor_id, id_estacion)
+        if valor is not None:
+            ids_validos.append(id_estacion)
+            valores.append(valor)
+    return ids_validos, valores
+
+
+def _datos_sensores(seccion_elem, etiqueta):
+    """(id, nombre, ids de estación, textos) de cada sensor de una sección"""
+    if seccion_elem is None:
+        return []
+    datos = []
+    for sensor_elem in seccion_elem.findall(etiqueta):
+        frecuencias = sensor_elem.findall('frecuencia')
+        datos.append((sensor_elem.get('id'), sensor_elem.get('nombre'),
+                      [freq_elem.get('idEstacion') for freq_elem in frecuencias],
+                      [freq_elem.text for freq_elem in frecuencias]))
+    return datos
+
+
+def construir_campo_desde_xml(campo_elem, reporte=None):
+    """
+    Crea un CampoAgricola a partir de un elemento <campo> del archivo de entrada.
+    Con un ReporteValidacion, además valida el campo y anota los problemas.
+    """
+    estaciones_base = campo_elem.find('estacionesBase')
+    estaciones = ([(estacion_elem.get('id'), estacion_elem.get('nombre'))
+                   for estacion_elem in estaciones_base.findall('estacion')]
+                  if estaciones_base is not None else [])
+    return armar_campo(campo_elem.get('id'), campo_elem.get('nombre'), estaciones,
+                       _datos_sensores(campo_elem.find('sensoresSuelo'), 'sensorS'),
+                       _datos_sensores(campo_elem.find('sensoresCultivo'), 'sensorT'),
+                       reporte)
+
+
+def armar_campo(campo_id, campo_nombre, estaciones, sensores_suelo, sensores_cultivo, reporte=None):
+    """
+    Crea un CampoAgricola a partir de los datos ya leídos por cualquiera de
+    los lectores: estaciones como (id, nombre) y sensores como
+    (id, nombre, ids de estación, textos de las frecuencias).
+    """
+    with Instrumentacion.medir("cargar_campo"):
+        campo = CampoAgricola(campo_id, campo_nombre)
+
+        registrar(f"➢ Cargando campo agrícola {campo_id}")
+
+        # Procesar estaciones base
+        for estacion_id, estacion_nombre in estaciones:
+            estacion = Estacion(estacion_id, estacion_nombre)
+            campo.agregar_estacion(estacion)
+            registrar(f"➢ Creando estación base {estacion_id}", DETALLE)
+
+        # Procesar sensores de suelo y de cultivo (frecuencias en bloque a las columnas del sensor)
+        for clase, datos_sensores, agregar in ((SensorSuelo, sensores_suelo, campo.agregar_sensor_suelo),
+                                               (SensorCultivo, sensores_cultivo, campo.agregar_sensor_cultivo)):
+            for sensor_id, sensor_nombre, ids_estacion, textos in datos_sensores:
+                sensor = clase(sensor_id, sensor_nombre, campo.tabla_ids)
+                sensor.agregar_frecuencias(*_convertir_frecuencias(ids_estacion, textos, campo_id,
+                                                                   sensor_id, reporte))
+                agregar(sensor)
+
+        if reporte is not None:
+            from ValidacionDatos import validar_campo
+            with Instrumentacion.medir("validar_campo"):
+                validar_campo(campo, reporte)
+
+    return campo
+
+
+def iterar_campos_xml(ruta_archivo, reporte=None, lector="etree"):
+    """
+    Recorre el archivo y entrega un CampoAgricola a la vez. Cada <campo> se
+    libera al terminar de construirlo, así la memoria no crece con la
+    cantidad de campos del archivo. Con reporte, cada campo se valida al
+    construirlo. lector: "etree" (iterparse) o "expat" (ver LectorExpat).
+    """
+    if lector == "expat":
+        from LectorExpat import iterar_campos_expat
+        return iterar_campos_expat(ruta_archivo, reporte)
+    if lector != "etree":
+        raise ValueError(f"Lector XML no válido: {lector}")
+    return _iterar_campos_etree(ruta_archivo, reporte)
+
+
+def _iterar_campos_etree(ruta_archivo, reporte):
+    raiz = None
+    profundidad = 0
+    for evento, elem in ET.iterparse(ruta_archivo, events=("start", "end")):
+        if evento == "start":
+            profundidad += 1
+            if raiz is None:
+                raiz = elem
+            continue
+
+        profundidad -= 1
+        # Solo los <campo> hijos directos de la raíz, igual que root.findall('campo')
+        if profundidad == 1 and elem.tag == 'campo':
+            campo = construir_campo_desde_xml(elem, reporte)
+            elem.clear()
+            raiz.clear()
+            yield campo
+
+
+def cargar_campos(ruta_archivo, reporte=None, lector="etree"):
+    """
+    Carga todos los campos del archivo en una ListaEnlazada (los errores se propagan).
+    Con un ReporteValidacion los campos se validan durante la carga.
+    """
+    campos = ListaEnlazada()
+    campos.extender(iterar_campos_xml(ruta_archivo, reporte, lector))
+    return campos
+
+
+def cargar_xml_streaming(ruta_archivo, callback):
+    """Carga el archivo campo por campo llamando a callback(campo); devuelve cuántos hubo"""
+    cantidad = 0
+    for campo in iterar_campos_xml(ruta_archivo):
+        callback(campo)
+        cantidad += 1
+    return cantidad
+
+
+def _bits_por_estacion(sensores):
+    """
+    Patrón empaquetado de cada estación que tiene alguna frecuencia: recorre
+    solo las frecuencias registradas de cada sensor (O(nnz)).
+    """
+    bits = {}
+    for posicion, sensor in enumerate(sensores):
+        bit = 1 << posicion
+        for id_estacion, valor in sensor.items_frecuencia():
+            if valor > 0:
+                bits[id_estacion] = bits.get(id_estacion, 0) | bit
+    return bits
+
+
 def calcular_patrones_estaciones(campo):
     """Calcula los patrones binarios para cada estación usando nuestra clase Patron"""
-    estaciones = _obtener_elementos_lista(campo.estaciones)
     sensores_suelo = _obtener_elementos_lista(campo.sensores_suelo)
     sensores_cultivo = _obtener_elementos_lista(campo.sensores_cultivo)
+    num_suelo = len(sensores_suelo)
+    num_cultivo = len(sensores_cultivo)
 
-    for estacion in estaciones:
-        # Patrón para sensores de suelo
-        patron_suelo = Patron()
-        for sensor in sensores_suelo:
-            frecuencia = sensor.obtener_frecuencia(estacion.id)
-            patron_suelo.agregar_valor(1 if frecuencia > 0 else 0)
-        estacion.patron_suelo = patron_suelo
+    # Las celdas sin frecuencia quedan en 0 sin necesidad de visitarlas
+    bits_suelo = _bits_por_estacion(sensores_suelo)
+    bits_cultivo = _bits_por_estacion(sensores_cultivo)
 
-        # Patrón para sensores de cultivo
-        patron_cultivo = Patron()
-        for sensor in sensores_cultivo:
-            frecuencia = sensor.obtener_frecuencia(estacion.id)
-            patron_cultivo.agregar_valor(1 if frecuencia > 0 else 0)
-        estacion.patron_cultivo = patron_cultivo
+    for estacion in campo.estaciones:
+        estacion.patron_suelo = Patron.desde_bits(bits_suelo.get(estacion.id, 0), num_suelo)
+        estacion.patron_cultivo = Patron.desde_bits(bits_cultivo.get(estacion.id, 0), num_cultivo)
 
 
 def patrones_iguales(patron1, patron2):
@@ -115,15 +269,264 @@ def agrupar_estaciones_comparacion_directa(campo):
     return grupos_finales
 
 
-def procesar_campo(campo):
-    print(f"➢ Procesando campo {campo.id}")
+def _clave_estacion(estacion):
+    """Clave canónica del par (patron_suelo, patron_cultivo) de una estación"""
+    if estacion.patron_suelo is None or estacion.patron_cultivo is None:
+        # patrones_iguales nunca considera igual un patrón ausente,
+        # así que la estación debe quedar sola en su grupo
+        return None
+    return (estacion.patron_suelo.clave(), estacion.patron_cultivo.clave())
 
-    # Calcular patrones para cada estación
-    calcular_patrones_estaciones(campo)
 
-    # Agrupar estaciones por patrones similares
-    agrupar_estaciones_comparacion_directa(campo)
+def agrupar_estaciones_hash(campo):
+    """
+    Agrupa estaciones en una sola pasada usando la clave de sus patrones.
+    Produce los mismos grupos, en el mismo orden, que la comparación directa.
+    """
+    grupos_por_clave = {}
+    grupos_ordenados = []
+    estaciones_procesadas = set()
+
+    actual = campo.estaciones.cabeza
+    while actual is not None:
+        estacion = actual.dato
+        actual = actual.siguiente
+
+        # Igual que en la comparación directa, un id repetido se ignora
+        if estacion.id in estaciones_procesadas:
+            continue
+        estaciones_procesadas.add(estacion.id)
+
+        clave = _clave_estacion(estacion)
+        if clave is None:
+            grupos_ordenados.append([estacion])
+            continue
+
+        estaciones_grupo = grupos_por_clave.get(clave)
+        if estaciones_grupo is None:
+            estaciones_grupo = [estacion]
+            grupos_por_clave[clave] = estaciones_grupo
+            grupos_ordenados.append(estaciones_grupo)
+        else:
+            estaciones_grupo.append(estacion)
+
+    grupos_finales = ListaEnlazada()
+    for estaciones_grupo in grupos_ordenados:
+        grupos_finales.insertar(GrupoEstaciones(estaciones_grupo))
 
+    return grupos_finales
+
+
+def agrupar_estaciones_matriz(campo):
+    """Agrupa estaciones con el backend de NumPy (filas únicas de patrones)"""
+    return campo.generar_matriz_frecuencias().construir_grupos()
+
+
+DISTANCIA_MAXIMA_TOLERANCIA = 1
+
+
+def _bits_combinados(estacion):
+    """Patrón de suelo y de cultivo en un solo entero (cultivo a continuación de suelo)"""
+    return estacion.patron_suelo.bits | (estacion.patron_cultivo.bits << estacion.patron_suelo.longitud)
+
+
+def _cortes_indice(longitud, partes):
+    """Divide longitud bits en partes trozos contiguos: lista de (desplazamiento, máscara)"""
+    cortes = []
+    inicio = 0
+    for parte in range(partes):
+        fin = longitud * (parte + 1) // partes
+        cortes.append((inicio, (1 << (fin - inicio)) - 1))
+        inicio = fin
+    return cortes
+
+
+def agrupar_estaciones_tolerancia(campo, distancia_maxima=DISTANCIA_MAXIMA_TOLERANCIA):
+    """
+    Agrupa estaciones cuyos patrones (suelo y cultivo juntos) difieren en a
+    lo sumo distancia_maxima bits. Igual que la comparación directa, cada
+    estación aún sin grupo (en orden) se lleva a todas las siguientes que
+    estén a esa distancia de ella; con distancia 0 da los mismos grupos.
+
+    Los candidatos salen de un índice multi-hash: el patrón se corta en
+    distancia_maxima + 1 trozos y, por el principio del palomar, dos patrones
+    a esa distancia coinciden exactamente en al menos un trozo. Solo se
+    compara con las estaciones que comparten algún trozo, no con todas.
+    """
+    if distancia_maxima < 0:
+        raise ValueError(f"La distancia máxima no puede ser negativa: {distancia_maxima}")
+
+    # Primero se juntan los patrones idénticos: el índice trabaja sobre patrones únicos
+    grupos_exactos = agrupar_estaciones_hash(campo).recorrer()
+    patrones = []
+    solitarios = set()
+    for numero, grupo in enumerate(grupos_exactos):
+        estacion = grupo.estaciones_lista[0]
+        if _clave_estacion(estacion) is None:
+            # Sin patrón la estación queda sola, como en los demás motores
+            solitarios.add(numero)
+            patrones.append(0)
+        else:
+            patrones.append(_bits_combinados(estacion))
+
+    longitud = 0
+    for grupo in grupos_exactos:
+        estacion = grupo.estaciones_lista[0]
+        if estacion.patron_suelo is not None and estacion.patron_cultivo is not None:
+            longitud = estacion.patron_suelo.longitud + estacion.patron_cultivo.longitud
+            break
+
+    cortes = _cortes_indice(longitud, distancia_maxima + 1)
+    indices = [{} for _ in cortes]
+    for numero, bits in enumerate(patrones):
+        if numero in solitarios:
+            continue
+        for indice, (desplazamiento, mascara) in zip(indices, cortes):
+            indice.setdefault((bits >> desplazamiento) & mascara, []).append(numero)
+
+    # Posición de cada estación, para dejar las de un grupo en el orden del campo
+    orden = {}
+    for posicion, estacion in enumerate(campo.estaciones):
+        orden.setdefault(estacion.id, posicion)
+
+    asignado = [False] * len(patrones)
+    grupos_finales = ListaEnlazada()
+    for numero, bits in enumerate(patrones):
+        if asignado[numero]:
+            continue
+        asignado[numero] = True
+        miembros = [numero]
+
+        if numero not in solitarios:
+            candidatos = set()
+            for indice, (desplazamiento, mascara) in zip(indices, cortes):
+                cubeta = indice[(bits >> desplazamiento) & mascara]
+                # Se descartan de la cubeta los patrones que ya tienen grupo
+                cubeta[:] = [otro for otro in cubeta if not asignado[otro]]
+                candidatos.update(cubeta)
+            if Instrumentacion.activa:
+                Instrumentacion.sumar("comparaciones_patron", len(candidatos))
+            for otro in sorted(candidatos):
+                if (bits ^ patrones[otro]).bit_count() <= distancia_maxima:
+                    asignado[otro] = True
+                    miembros.append(otro)
+
+        if len(miembros) == 1:
+            grupos_finales.insertar(grupos_exactos[numero])
+            continue
+        estaciones_grupo = [estacion for miembro in miembros for estacion in grupos_exactos[miembro]]
+        estaciones_grupo.sort(key=lambda estacion: orden[estacion.id])
+        grupos_finales.insertar(GrupoEstaciones(estaciones_grupo))
+
+    return grupos_finales
+
+
+MOTORES_AGRUPAMIENTO = {
+    "hash": agrupar_estaciones_hash,
+    "directa": agrupar_estaciones_comparacion_directa,
+    "matriz": agrupar_estaciones_matriz,
+    "tolerancia": agrupar_estaciones_tolerancia,
+}
+
+
+def agrupar_estaciones(campo, motor="hash", **opciones):
+    """
+    Agrupa las estaciones del campo con el motor indicado ("hash", "directa",
+    "matriz" o "tolerancia"). Las opciones van al motor, por ejemplo
+    distancia_maxima para "tolerancia".
+    """
+    funcion = MOTORES_AGRUPAMIENTO.get(motor)
+    if funcion is None:
+        raise ValueError(f"Motor de agrupamiento no válido: {motor}")
+    return funcion(campo, **opciones)
+
+
+def calcular_frecuencias_reducidas(campo):
+    """
+    Suma una sola vez las frecuencias de cada sensor por grupo y las deja en
+    grupo.frecuencias_totales, que usan la salida XML y las gráficas.
+    Recorre solo las frecuencias registradas de cada sensor; con NumPy, las
+    columnas que comparten la tabla de ids del campo se suman vectorizadas.
+    """
+    grupos = campo.grupos_estaciones.recorrer()
+    tabla_ids = campo.tabla_ids
+    grupo_de_estacion = {}
+    numero_grupo = [-1] * len(tabla_ids)  # índice en la tabla de ids -> número de grupo
+    for numero, grupo in enumerate(grupos):
+        grupo.frecuencias_totales = {}
+        for estacion in grupo:
+            grupo_de_estacion[estacion.id] = grupo
+            indice = tabla_ids.buscar(estacion.id)
+            if indice is not None:
+                numero_grupo[indice] = numero
+    try:
+        import numpy as np
+        etiquetas = np.array(numero_grupo, dtype=np.int64)
+    except ImportError:  # sin NumPy las sumas por grupo se hacen en Python
+        etiquetas = None
+
+    for sensores in (campo.sensores_suelo, campo.sensores_cultivo):
+        for sensor in sensores:
+            # Las sumas vectorizadas son int64: solo para columnas de 32 bits, que no desbordan
+            if (etiquetas is not None and sensor.frecuencias.tabla_ids is tabla_ids and
+                    sensor.frecuencias.valores_32_bits()):
+                _sumar_columnas(sensor, etiquetas, grupos)
+                continue
+            for id_estacion, valor in sensor.items_frecuencia():
+                grupo = grupo_de_estacion.get(id_estacion)
+                if grupo is not None:
+                    totales = grupo.frecuencias_totales
+                    totales[sensor] = totales.get(sensor, 0) + valor
+
+
+def _sumar_columnas(sensor, etiquetas, grupos):
+    """Suma por grupo las columnas de un sensor con NumPy (gana la primera frecuencia de cada estación)"""
+    import numpy as np
+
+    estaciones, valores = sensor.frecuencias.como_numpy()
+    if len(estaciones) == 0:
+        return
+    _, primeras = np.unique(estaciones, return_index=True)
+    numeros = etiquetas[estaciones[primeras]]
+    agrupadas = numeros >= 0
+    numeros = numeros[agrupadas]
+
+    sumas = np.zeros(len(grupos), dtype=np.int64)
+    np.add.at(sumas, numeros, valores[primeras][agrupadas])
+    presentes = np.bincount(numeros, minlength=len(grupos))
+    for numero, total in zip(np.flatnonzero(presentes).tolist(), sumas[presentes > 0].tolist()):
+        grupos[numero].frecuencias_totales[sensor] = total
+
+
+def calcular_campo(campo, motor="hash", **opciones):
+    """Calcula patrones y grupos del campo sin imprimir nada (opciones: ver agrupar_estaciones)"""
+    # Un cálculo completo deja sin efecto los cambios pendientes
+    campo.estaciones_sucias = {}
+    campo.agrupamiento_incremental = None
+
+    if motor == "matriz":
+        # El motor matricial solo hace agrupamiento exacto: no recibe opciones
+        if opciones:
+            raise TypeError(f"El motor matriz no acepta opciones: {', '.join(opciones)}")
+        # Patrones, grupos y frecuencias reducidas en bloque con NumPy
+        from MatrizFrecuencias import procesar_campo_matricial
+        with Instrumentacion.medir("procesar_campo_matricial"):
+            procesar_campo_matricial(campo)
+    else:
+        # Calcular patrones para cada estación
+        with Instrumentacion.medir("calcular_patrones_estaciones"):
+            calcular_patrones_estaciones(campo)
+
+        # Agrupar estaciones por patrones similares
+        with Instrumentacion.medir(f"agrupar_estaciones_{motor}"):
+            campo.grupos_estaciones = agrupar_estaciones(campo, motor, **opciones)
+
+        # Frecuencias reducidas compartidas por la salida y las gráficas
+        with Instrumentacion.medir("calcular_frecuencias_reducidas"):
+            calcular_frecuencias_reducidas(campo)
+
+
+def _imprimir_resumen_campo(campo):
     # Contar estaciones y grupos
     num_estaciones = 0
     actual = campo.estaciones.cabeza
@@ -137,89 +540,430 @@ def procesar_campo(campo):
         num_grupos += 1
         actual = actual.siguiente
 
-    print(f"➢ Campo {campo.id} procesado exitosamente")
-    print(f"➢ Estaciones originales: {num_estaciones}")
-    print(f"➢ Grupos reducidos: {num_grupos}")
+    registrar(f"➢ Campo {campo.id} procesado exitosamente")
+    registrar(f"➢ Estaciones originales: {num_estaciones}")
+    registrar(f"➢ Grupos reducidos: {num_grupos}")
 
 
-def generar_xml_salida(campos, ruta_salida):
-    try:
-        root = ET.Element('camposAgricolas')
+def procesar_campo(campo, motor="hash", **opciones):
+    registrar(f"➢ Procesando campo {campo.id}")
+    with Instrumentacion.medir_campo(campo):
+        calcular_campo(campo, motor, **opciones)
+    _imprimir_resumen_campo(campo)
 
-        actual_campo = campos.cabeza
-        while actual_campo is not None:
-            campo = actual_campo.dato
-            campo_xml = ET.SubElement(root, 'campo', id=campo.id, nombre=campo.nombre)
 
-            # Estaciones base reducidas
-            estaciones_reducidas_xml = ET.SubElement(campo_xml, 'estacionesBaseReducidas')
+def calcular_patron_estacion(estacion, sensores_suelo, sensores_cultivo):
+    """Recalcula los patrones de una sola estación"""
+    bits = 0
+    for posicion, sensor in enumerate(sensores_suelo):
+        if sensor.obtener_frecuencia(estacion.id) > 0:
+            bits |= 1 << posicion
+    estacion.patron_suelo = Patron.desde_bits(bits, len(sensores_suelo))
+
+    bits = 0
+    for posicion, sensor in enumerate(sensores_cultivo):
+        if sensor.obtener_frecuencia(estacion.id) > 0:
+            bits |= 1 << posicion
+    estacion.patron_cultivo = Patron.desde_bits(bits, len(sensores_cultivo))
+
+
+class AgrupamientoIncremental:
+    """
+    Estado para reagrupar un campo tocando solo las estaciones modificadas.
+
+    Guarda el grupo de cada estación y su número de orden, de modo que los
+    grupos y sus estaciones quedan en el mismo orden que produce
+    agrupar_estaciones_hash sobre el campo completo.
+    """
+
+    def __init__(self, campo):
+        self.campo = campo
+        self.sensores_suelo = campo.sensores_suelo.recorrer()
+        self.sensores_cultivo = campo.sensores_cultivo.recorrer()
+        self.sensores = self.sensores_suelo + self.sensores_cultivo
+
+        self.orden = {}            # idEstacion -> número de orden
+        self.siguiente_orden = 0
+        self.agrupadas = {}        # idEstacion -> estación que está en un grupo
+        self.clave_de_estacion = {}
+        self.grupos = {}           # clave -> GrupoEstaciones
+
+        for estacion in campo.estaciones:
+            if estacion.id not in self.orden:
+                self.orden[estacion.id] = self.siguiente_orden
+                self.siguiente_orden += 1
+
+        for grupo in campo.grupos_estaciones:
+            clave = _clave_estacion(grupo.estaciones_lista[0])
+            self.grupos[clave] = grupo
+            for estacion in grupo:
+                self.agrupadas[estacion.id] = estacion
+                self.clave_de_estacion[estacion.id] = clave
+
+    def vigente(self):
+        """Indica si los sensores del campo siguen siendo los mismos"""
+        return (len(self.sensores_suelo) == len(self.campo.sensores_suelo) and
+                len(self.sensores_cultivo) == len(self.campo.sensores_cultivo))
+
+    def _aporte(self, id_estacion, cambios=None):
+        """Frecuencias de la estación por sensor; con cambios, las de antes de aplicarlos"""
+        aporte = {}
+        for sensor in self.sensores:
+            valor = sensor.obtener_frecuencia(id_estacion)
+            if cambios:
+                valor -= cambios.get(sensor, 0)
+            if valor:
+                aporte[sensor] = valor
+        return aporte
+
+    @staticmethod
+    def _sumar(grupo, aporte, signo):
+        totales = grupo.frecuencias_totales
+        for sensor, valor in aporte.items():
+            total = totales.get(sensor, 0) + signo * valor
+            if total:
+                totales[sensor] = total
+            else:
+                totales.pop(sensor, None)
+
+    def _posicion(self, estaciones, numero_orden):
+        """Búsqueda binaria de la posición de inserción según el orden"""
+        inicio, fin = 0, len(estaciones)
+        while inicio < fin:
+            medio = (inicio + fin) // 2
+            if self.orden[estaciones[medio].id] < numero_orden:
+                inicio = medio + 1
+            else:
+                fin = medio
+        return inicio
+
+    def _quitar(self, id_estacion, cambios, conservar_orden):
+        """Saca una estación de su grupo; devuelve True si cambia el orden de los grupos"""
+        estacion = self.agrupadas.pop(id_estacion)
+        clave = self.clave_de_estacion.pop(id_estacion)
+        grupo = self.grupos[clave]
+
+        era_primera = grupo.estaciones_lista[0] is estacion
+        grupo.estaciones_lista.remove(estacion)
+        self._sumar(grupo, self._aporte(id_estacion, cambios), -1)
+        if not conservar_orden:
+            del self.orden[id_estacion]
+
+        if not grupo.estaciones_lista:
+            del self.grupos[clave]
+            return True
+        grupo.actualizar_representante()
+        return era_primera
+
+    def _poner(self, estacion):
+        """Agrega una estación a su grupo; devuelve True si cambia el orden de los grupos"""
+        if estacion.id not in self.orden:
+            self.orden[estacion.id] = self.siguiente_orden
+            self.siguiente_orden += 1
+
+        clave = _clave_estacion(estacion)
+        grupo = self.grupos.get(clave)
+        nuevo = grupo is None
+        if nuevo:
+            grupo = GrupoEstaciones([])
+            grupo.frecuencias_totales = {}
+            self.grupos[clave] = grupo
+
+        posicion = self._posicion(grupo.estaciones_lista, self.orden[estacion.id])
+        grupo.estaciones_lista.insert(posicion, estacion)
+        grupo.actualizar_representante()
+        self._sumar(grupo, self._aporte(estacion.id), 1)
+
+        self.agrupadas[estacion.id] = estacion
+        self.clave_de_estacion[estacion.id] = clave
+        return nuevo or posicion == 0
+
+    def aplicar(self, estaciones_sucias):
+        """Actualiza patrones, grupos y frecuencias reducidas de las estaciones sucias"""
+        reordenar = False
+
+        for id_estacion, cambios in estaciones_sucias.items():
+            anterior = self.agrupadas.get(id_estacion)
+            # Igual que al agrupar el campo completo, un id repetido usa la primera estación
+            actual = self.campo.obtener_estacion_por_id(id_estacion)
+            if actual is not None:
+                calcular_patron_estacion(actual, self.sensores_suelo, self.sensores_cultivo)
+                # Las repetidas no agrupan, pero tienen los mismos patrones que en un cálculo completo
+                for repetida in self.campo.obtener_estaciones_repetidas(id_estacion):
+                    repetida.patron_suelo = actual.patron_suelo.clonar()
+                    repetida.patron_cultivo = actual.patron_cultivo.clonar()
+
+            if (anterior is not None and actual is anterior and
+                    _clave_estacion(actual) == self.clave_de_estacion[id_estacion]):
+                # Mismo grupo: solo cambian sus frecuencias reducidas
+                self._sumar(self.grupos[self.clave_de_estacion[id_estacion]], cambios, 1)
+                continue
+
+            if anterior is not None:
+                reordenar |= self._quitar(id_estacion, cambios, conservar_orden=actual is anterior)
+            if actual is not None:
+                reordenar |= self._poner(actual)
 
-            actual_grupo = campo.grupos_estaciones.cabeza
-            while actual_grupo is not None:
-                grupo = actual_grupo.dato
-                ET.SubElement(estaciones_reducidas_xml, 'estacion',
-                              id=grupo.id_representante,
-                              nombre=grupo.nombre_representante)
-                actual_grupo = actual_grupo.siguiente
+        if reordenar:
+            grupos = sorted(self.grupos.values(),
+                            key=lambda grupo: self.orden[grupo.estaciones_lista[0].id])
+            self.campo.grupos_estaciones = ListaEnlazada()
+            self.campo.grupos_estaciones.extender(grupos)
 
-            # Sensores de suelo con frecuencias reducidas
-            sensores_suelo_xml = ET.SubElement(campo_xml, 'sensoresSuelo')
 
-            actual_sensor = campo.sensores_suelo.cabeza
-            while actual_sensor is not None:
-                sensor = actual_sensor.dato
-                sensor_xml = ET.SubElement(sensores_suelo_xml, 'sensorS',
-                                           id=sensor.id, nombre=sensor.nombre)
+# Motores de agrupamiento exacto: sus grupos son los que mantiene AgrupamientoIncremental
+MOTORES_INCREMENTALES = ("hash", "directa", "matriz")
 
-                actual_grupo = campo.grupos_estaciones.cabeza
-                while actual_grupo is not None:
-                    grupo = actual_grupo.dato
-                    frecuencia_total = 0
 
-                    actual_estacion = grupo.estaciones.cabeza
-                    while actual_estacion is not None:
-                        estacion = actual_estacion.dato
-                        frecuencia_total += sensor.obtener_frecuencia(estacion.id)
-                        actual_estacion = actual_estacion.siguiente
+def reprocesar_campo(campo, motor="hash", **opciones):
+    """
+    Aplica los cambios hechos con insertar_estacion, eliminar_estacion y
+    actualizar_frecuencia recalculando solo las estaciones afectadas. La
+    primera vez (o si cambiaron los sensores) se procesa el campo completo
+    con motor. Solo se aceptan motores de agrupamiento exacto (y "tolerancia"
+    con distancia 0). Devuelve la cantidad de estaciones recalculadas.
+    """
+    exacto = (motor in MOTORES_INCREMENTALES or
+              motor == "tolerancia" and opciones.get("distancia_maxima", DISTANCIA_MAXIMA_TOLERANCIA) == 0)
+    if not exacto:
+        raise ValueError(f"El motor {motor} no se puede actualizar de forma incremental; "
+                         f"use uno de {', '.join(MOTORES_INCREMENTALES)}")
+
+    estado = campo.agrupamiento_incremental
+    if estado is None or not estado.vigente():
+        calcular_campo(campo, motor, **opciones)
+        campo.agrupamiento_incremental = AgrupamientoIncremental(campo)
+        return len(campo.estaciones)
+
+    estaciones_sucias = campo.estaciones_sucias
+    campo.estaciones_sucias = {}
+    if estaciones_sucias:
+        # La matriz materializada ya no corresponde a los datos
+        campo.matriz_frecuencias = None
+        with Instrumentacion.medir("reprocesar_campo"):
+            estado.aplicar(estaciones_sucias)
+    return len(estaciones_sucias)
+
+
+def _empaquetar_campo(campo):
+    """Datos mínimos del campo, en tipos nativos baratos de serializar"""
+    return (
+        campo.id,
+        campo.nombre,
+        [(estacion.id, estacion.nombre) for estacion in campo.estaciones],
+        [(sensor.id, sensor.nombre, list(sensor.items_frecuencia())) for sensor in campo.sensores_suelo],
+        [(sensor.id, sensor.nombre, list(sensor.items_frecuencia())) for sensor in campo.sensores_cultivo],
+    )
+
+
+def _desempaquetar_campo(paquete):
+    campo_id, campo_nombre, estaciones, sensores_suelo, sensores_cultivo = paquete
+    campo = CampoAgricola(campo_id, campo_nombre)
+    for estacion_id, estacion_nombre in estaciones:
+        campo.agregar_estacion(Estacion(estacion_id, estacion_nombre))
+    for clase, sensores, agregar in ((SensorSuelo, sensores_suelo, campo.agregar_sensor_suelo),
+                                     (SensorCultivo, sensores_cultivo, campo.agregar_sensor_cultivo)):
+        for sensor_id, sensor_nombre, frecuencias in sensores:
+            sensor = clase(sensor_id, sensor_nombre, campo.tabla_ids)
+            sensor.agregar_frecuencias([id_estacion for id_estacion, _ in frecuencias],
+                                       [valor for _, valor in frecuencias])
+            agregar(sensor)
+    return campo
+
+
+def _iniciar_proceso():
+    # El hijo hereda el heap del padre; congelarlo evita que el recolector
+    # de basura lo recorra una y otra vez mientras se deserializan los campos
+    import gc
+    gc.freeze()
+
+
+def _procesar_campo_en_proceso(paquete, motor, opciones, instrumentar=False):
+    """
+    Trabajo de cada proceso del pool: reconstruye el campo, lo calcula y
+    devuelve solo lo necesario para aplicar el resultado en el padre (con
+    instrumentar, también lo medido, que el padre suma a su reporte).
+    """
+    Instrumentacion.iniciar_en_proceso(instrumentar)
+    campo = _desempaquetar_campo(paquete)
+    with Instrumentacion.medir_campo(campo):
+        calcular_campo(campo, motor, **opciones)
 
-                    if frecuencia_total > 0:
-                        frecuencia_elem = ET.SubElement(sensor_xml, 'frecuencia')
-                        frecuencia_elem.set('idEstacion', grupo.id_representante)
-                        frecuencia_elem.text = str(frecuencia_total)
+    patrones = []
+    for estacion in campo.estaciones:
+        patrones.append((estacion.patron_suelo.bits, estacion.patron_suelo.longitud,
+                         estacion.patron_cultivo.bits, estacion.patron_cultivo.longitud))
 
-                    actual_grupo = actual_grupo.siguiente
+    posiciones = {}
+    for posicion, estacion in enumerate(campo.estaciones):
+        posiciones[id(estacion)] = posicion
+    posiciones_sensores = {}
+    for posicion, sensor in enumerate(campo.sensores_suelo):
+        posiciones_sensores[id(sensor)] = (0, posicion)
+    for posicion, sensor in enumerate(campo.sensores_cultivo):
+        posiciones_sensores[id(sensor)] = (1, posicion)
 
-                actual_sensor = actual_sensor.siguiente
+    grupos = []
+    for grupo in campo.grupos_estaciones:
+        totales = [(posiciones_sensores[id(sensor)], total)
+                   for sensor, total in grupo.frecuencias_totales.items()]
+        grupos.append(([posiciones[id(estacion)] for estacion in grupo], totales))
 
-            # Sensores de cultivo con frecuencias reducidas
-            sensores_cultivo_xml = ET.SubElement(campo_xml, 'sensoresCultivo')
+    return patrones, grupos, Instrumentacion.exportar() if instrumentar else None
 
-            actual_sensor = campo.sensores_cultivo.cabeza
-            while actual_sensor is not None:
-                sensor = actual_sensor.dato
-                sensor_xml = ET.SubElement(sensores_cultivo_xml, 'sensorT',
-                                           id=sensor.id, nombre=sensor.nombre)
 
-                actual_grupo = campo.grupos_estaciones.cabeza
-                while actual_grupo is not None:
-                    grupo = actual_grupo.dato
-                    frecuencia_total = 0
+def _aplicar_resultado_campo(campo, resultado):
+    """Copia patrones y grupos calculados en otro proceso a los objetos originales"""
+    patrones, grupos, medicion = resultado
+    if medicion is not None and Instrumentacion.activa:
+        Instrumentacion.combinar(medicion)
+    estaciones = campo.estaciones.recorrer()
+    campo.estaciones_sucias = {}
+    campo.agrupamiento_incremental = None
 
-                    actual_estacion = grupo.estaciones.cabeza
-                    while actual_estacion is not None:
-                        estacion = actual_estacion.dato
-                        frecuencia_total += sensor.obtener_frecuencia(estacion.id)
-                        actual_estacion = actual_estacion.siguiente
+    for estacion, (bits_suelo, num_suelo, bits_cultivo, num_cultivo) in zip(estaciones, patrones):
+        estacion.patron_suelo = Patron.desde_bits(bits_suelo, num_suelo)
+        estacion.patron_cultivo = Patron.desde_bits(bits_cultivo, num_cultivo)
 
-                    if frecuencia_total > 0:
-                        frecuencia_elem = ET.SubElement(sensor_xml, 'frecuencia')
-                        frecuencia_elem.set('idEstacion', grupo.id_representante)
-                        frecuencia_elem.text = str(frecuencia_total)
+    sensores = (campo.sensores_suelo.recorrer(), campo.sensores_cultivo.recorrer())
 
-                    actual_grupo = actual_grupo.siguiente
+    campo.grupos_estaciones = ListaEnlazada()
+    for posiciones, totales in grupos:
+        grupo = GrupoEstaciones([estaciones[posicion] for posicion in posiciones])
+        grupo.frecuencias_totales = {}
+        for (tipo, posicion), total in totales:
+            grupo.frecuencias_totales[sensores[tipo][posicion]] = total
+        campo.grupos_estaciones.insertar(grupo)
 
-                actual_sensor = actual_sensor.siguiente
 
+class PoolCampos:
+    """
+    Pool de procesos para calcular campos fuera del proceso principal.
+    enviar() manda un campo a un proceso y devuelve su futuro; aplicar()
+    espera ese resultado, lo copia a los objetos del campo y lo reporta
+    igual que procesar_campo. Se usa como context manager.
+    """
+
+    def __init__(self, motor="hash", max_workers=None, **opciones):
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.motor = motor
+        self.opciones = opciones
+        self.executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_iniciar_proceso)
+
+    def enviar(self, campo):
+        # Cada hijo devuelve sus etapas y su registro por campo si hay instrumentación
+        return self.executor.submit(_procesar_campo_en_proceso, _empaquetar_campo(campo),
+                                    self.motor, self.opciones, Instrumentacion.activa)
+
+    @staticmethod
+    def aplicar(campo, futuro):
+        resultado = futuro.result()
+        registrar(f"➢ Procesando campo {campo.id}")
+        _aplicar_resultado_campo(campo, resultado)
+        _imprimir_resumen_campo(campo)
+
+    def cerrar(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_error, error, traza):
+        self.cerrar()
+        return False
+
+
+def procesar_campos_paralelo(campos, motor="hash", max_workers=None, **opciones):
+    """
+    Procesa los campos en un pool de procesos (PoolCampos). Los resultados se
+    aplican y se reportan en el mismo orden de entrada que el procesamiento serial.
+    """
+    # Aquí se mide además el pool completo
+    with Instrumentacion.medir("procesar_campos_paralelo"), \
+            PoolCampos(motor, max_workers, **opciones) as pool:
+        pendientes = [(campo, pool.enviar(campo)) for campo in campos]
+        for campo, futuro in pendientes:
+            pool.aplicar(campo, futuro)
+
+
+def construir_campo_xml(campo):
+    """Construye el elemento <campo> de salida con las estaciones reducidas"""
+    campo_xml = ET.Element('campo', id=campo.id, nombre=campo.nombre)
+
+    # Estaciones base reducidas
+    estaciones_reducidas_xml = ET.SubElement(campo_xml, 'estacionesBaseReducidas')
+
+    actual_grupo = campo.grupos_estaciones.cabeza
+    while actual_grupo is not None:
+        grupo = actual_grupo.dato
+        ET.SubElement(estaciones_reducidas_xml, 'estacion',
+                      id=grupo.id_representante,
+                      nombre=grupo.nombre_representante)
+        actual_grupo = actual_grupo.siguiente
+
+    # Sensores de suelo con frecuencias reducidas
+    sensores_suelo_xml = ET.SubElement(campo_xml, 'sensoresSuelo')
+
+    actual_sensor = campo.sensores_suelo.cabeza
+    while actual_sensor is not None:
+        sensor = actual_sensor.dato
+        sensor_xml = ET.SubElement(sensores_suelo_xml, 'sensorS',
+                                   id=sensor.id, nombre=sensor.nombre)
+
+        actual_grupo = campo.grupos_estaciones.cabeza
+        while actual_grupo is not None:
+            grupo = actual_grupo.dato
+            frecuencia_total = grupo.obtener_frecuencia_total(sensor, "suelo")
+
+            if frecuencia_total > 0:
+                frecuencia_elem = ET.SubElement(sensor_xml, 'frecuencia')
+                frecuencia_elem.set('idEstacion', grupo.id_representante)
+                frecuencia_elem.text = str(frecuencia_total)
+
+            actual_grupo = actual_grupo.siguiente
+
+        actual_sensor = actual_sensor.siguiente
+
+    # Sensores de cultivo con frecuencias reducidas
+    sensores_cultivo_xml = ET.SubElement(campo_xml, 'sensoresCultivo')
+
+    actual_sensor = campo.sensores_cultivo.cabeza
+    while actual_sensor is not None:
+        sensor = actual_sensor.dato
+        sensor_xml = ET.SubElement(sensores_cultivo_xml, 'sensorT',
+                                   id=sensor.id, nombre=sensor.nombre)
+
+        actual_grupo = campo.grupos_estaciones.cabeza
+        while actual_grupo is not None:
+            grupo = actual_grupo.dato
+            frecuencia_total = grupo.obtener_frecuencia_total(sensor, "cultivo")
+
+            if frecuencia_total > 0:
+                frecuencia_elem = ET.SubElement(sensor_xml, 'frecuencia')
+                frecuencia_elem.set('idEstacion', grupo.id_representante)
+                frecuencia_elem.text = str(frecuencia_total)
+
+            actual_grupo = actual_grupo.siguiente
+
+        actual_sensor = actual_sensor.siguiente
+
+    return campo_xml
+
+
+def generar_xml_salida(campos, ruta_salida):
+    with Instrumentacion.medir("generar_xml_salida"):
+        return _generar_xml_salida(campos, ruta_salida)
+
+
+def _generar_xml_salida(campos, ruta_salida):
+    try:
+        root = ET.Element('camposAgricolas')
+
+        actual_campo = campos.cabeza
+        while actual_campo is not None:
+            campo = actual_campo.dato
+            root.append(construir_campo_xml(campo))
             actual_campo = actual_campo.siguiente
 
         # Formatear y guardar el XML
@@ -227,9 +971,107 @@ def generar_xml_salida(campos, ruta_salida):
         tree = ET.ElementTree(root)
         tree.write(ruta_salida, encoding='utf-8', xml_declaration=True)
 
-        print(f"➢ Archivo de salida generado en: {ruta_salida}")
+        registrar(f"➢ Archivo de salida generado en: {ruta_salida}")
         return True
 
     except Exception as e:
-        print(f"❌ Error al generar archivo de salida: {e}")
-        return False
\ No newline at end of file
+        registrar_error(f"❌ Error al generar archivo de salida: {e}")
+        return False
+
+
+class EscritorXMLSalida:
+    """
+    Escribe el archivo de salida campo por campo, sin armar el árbol completo.
+    Con indentar=True el resultado es idéntico byte a byte al de generar_xml_salida.
+
+        with EscritorXMLSalida(ruta) as escritor:
+            for campo in iterar_campos_xml(entrada):
+                procesar_campo(campo)
+                escritor.escribir_campo(campo)
+    """
+
+    ESPACIO = "    "
+
+    def __init__(self, ruta_salida, indentar=True):
+        self.ruta_salida = ruta_salida
+        self.indentar = indentar
+        self.archivo = None
+        self.campos_escritos = 0
+
+    def abrir(self):
+        # Mismos parámetros que usa ElementTree.write con encoding='utf-8'
+        self.archivo = open(self.ruta_salida, "w", encoding="utf-8", errors="xmlcharrefreplace")
+        self.archivo.write("<?xml version='1.0' encoding='utf-8'?>\n<camposAgricolas")
+        return self
+
+    def escribir_campo(self, campo):
+        with Instrumentacion.medir("escribir_campo_xml"):
+            campo_xml = construir_campo_xml(campo)
+            if self.campos_escritos == 0:
+                self.archivo.write(">")
+            if self.indentar:
+                ET.indent(campo_xml, space=self.ESPACIO, level=1)
+                self.archivo.write("\n" + self.ESPACIO)
+            self.archivo.write(ET.tostring(campo_xml, encoding="unicode"))
+        self.campos_escritos += 1
+
+    def cerrar(self):
+        if self.archivo is None:
+            return
+        if self.campos_escritos == 0:
+            self.archivo.write(" />")
+        elif self.indentar:
+            self.archivo.write("\n</camposAgricolas>")
+        else:
+            self.archivo.write("</camposAgricolas>")
+        self.archivo.close()
+        self.archivo = None
+
+    def descartar(self):
+        """Cierra sin la etiqueta final y borra el archivo: no queda una salida a medias"""
+        if self.archivo is None:
+            return
+        self.archivo.close()
+        self.archivo = None
+        try:
+            os.remove(self.ruta_salida)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self.abrir()
+
+    def __exit__(self, tipo_error, error, traza):
+        if tipo_error is None:
+            self.cerrar()
+        else:
+            self.descartar()
+        return False
+
+
+def generar_xml_salida_incremental(campos, ruta_salida, indentar=True):
+    """Igual que generar_xml_salida, pero emite cada <campo> en cuanto se recorre"""
+    try:
+        with EscritorXMLSalida(ruta_salida, indentar) as escritor:
+            for campo in campos:
+                escritor.escribir_campo(campo)
+
+        registrar(f"➢ Archivo de salida generado en: {ruta_salida}")
+        return True
+
+    except Exception as e:
+        registrar_error(f"❌ Error al generar archivo de salida: {e}")
+        return False
+
+
+def procesar_xml_streaming(ruta_entrada, ruta_salida, motor="hash", indentar=True, **opciones):
+    """Carga, procesa y escribe campo por campo con memoria acotada; devuelve cuántos campos hubo"""
+    with EscritorXMLSalida(ruta_salida, indentar) as escritor:
+        for campo in iterar_campos_xml(ruta_entrada):
+            procesar_campo(campo, motor, **opciones)
+            escritor.escribir_campo(campo)
+    registrar(f"➢ Archivo de salida generado en: {ruta_salida}")
+    return escritor.campos_escritos
+
+
+Instrumentacion.registrar_contador(sys.modules[__name__], "patrones_iguales", "comparaciones_patron")
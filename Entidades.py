@@ -1,6 +1,12 @@
-from EstructuraBase import ListaEnlazada
+from array import array
+
+import Instrumentacion
+from EstructuraBase import ListaEnlazada, TablaIds, internar
+
 
 class Frecuencia:
+    __slots__ = ("id_estacion", "valor")
+
     def __init__(self, id_estacion, valor):
         self.id_estacion = id_estacion
         self.valor = valor
@@ -9,7 +15,173 @@ class Frecuencia:
         return f"Frecuencia para estación {self.id_estacion}: {self.valor}"
 
 
+class FrecuenciasColumnares:
+    """
+    Frecuencias de un sensor en dos columnas paralelas: el índice de la
+    estación en una tabla de ids internados y el valor, ambas array('i')
+    (4 bytes por dato). La columna de valores pasa a 'q' si algún valor no
+    cabe en 32 bits, y a una lista de enteros de Python si tampoco cabe en 64.
+
+    Se recorre igual que la lista enlazada de Frecuencia que usaba antes el
+    sensor; los objetos Frecuencia se crean solo al iterar.
+    """
+
+    __slots__ = ("tabla_ids", "estaciones", "valores", "_posiciones")
+
+    def __init__(self, tabla_ids=None):
+        self.tabla_ids = tabla_ids if tabla_ids is not None else TablaIds()
+        self.estaciones = array('i')
+        self.valores = array('i')
+        # índice de estación -> posición de su primera frecuencia; se arma al primer uso
+        self._posiciones = None
+
+    def _ampliar_valores(self):
+        """'i' -> 'q' -> lista de enteros de Python (sin límite de tamaño)"""
+        if self.valores.typecode == 'i':
+            self.valores = array('q', self.valores)
+        else:
+            self.valores = list(self.valores)
+
+    def valores_32_bits(self):
+        """Indica si todos los valores caben en 32 bits (sus sumas no desbordan un int64)"""
+        return getattr(self.valores, "typecode", None) == 'i'
+
+    def agregar(self, id_estacion, valor):
+        indice = self.tabla_ids.indice(id_estacion)
+        while True:
+            try:
+                self.valores.append(valor)
+                break
+            except OverflowError:
+                self._ampliar_valores()
+        self.estaciones.append(indice)
+        if self._posiciones is not None and indice not in self._posiciones:
+            self._posiciones[indice] = len(self.estaciones) - 1
+
+    def agregar_lote(self, ids_estacion, valores):
+        """Agrega muchas frecuencias de una vez (listas paralelas de ids y valores)"""
+        if len(ids_estacion) != len(valores):
+            raise ValueError(f"Cantidad distinta de ids ({len(ids_estacion)}) y de valores ({len(valores)})")
+        while True:
+            try:
+                columna = (array(self.valores.typecode, valores) if isinstance(self.valores, array)
+                           else list(valores))
+                break
+            except OverflowError:
+                self._ampliar_valores()
+        self.estaciones.extend(array('i', self.tabla_ids.indices(ids_estacion)))
+        self.valores.extend(columna)
+        self._posiciones = None
+
+    def asignar_columnas(self, estaciones, valores):
+        """Reemplaza las dos columnas (arrays con índices ya referidos a tabla_ids)"""
+        if len(estaciones) != len(valores):
+            raise ValueError(f"Cantidad distinta de índices ({len(estaciones)}) y de valores ({len(valores)})")
+        self.estaciones = estaciones
+        self.valores = valores
+        self._posiciones = None
+
+    def _indice_posiciones(self):
+        if self._posiciones is None:
+            posiciones = {}
+            for posicion, indice in enumerate(self.estaciones):
+                if indice not in posiciones:
+                    posiciones[indice] = posicion
+            self._posiciones = posiciones
+        return self._posiciones
+
+    def _posicion(self, id_estacion):
+        indice = self.tabla_ids.buscar(id_estacion)
+        if indice is None:
+            return None
+        return self._indice_posiciones().get(indice)
+
+    def obtener(self, id_estacion):
+        """Valor vigente (la primera frecuencia de la estación), 0 si no tiene"""
+        posicion = self._posicion(id_estacion)
+        if posicion is None:
+            return 0
+        return self.valores[posicion]
+
+    def actualizar(self, id_estacion, valor):
+        """Cambia el valor vigente (o lo agrega); devuelve el anterior"""
+        posicion = self._posicion(id_estacion)
+        if posicion is None:
+            self.agregar(id_estacion, valor)
+            return 0
+        anterior = self.valores[posicion]
+        while True:
+            try:
+                self.valores[posicion] = valor
+                break
+            except OverflowError:
+                self._ampliar_valores()
+        return anterior
+
+    def eliminar(self, id_estacion):
+        """Quita todas las frecuencias de la estación; devuelve el valor que estaba vigente"""
+        posicion = self._posicion(id_estacion)
+        if posicion is None:
+            return 0
+        anterior = self.valores[posicion]
+        indice = self.estaciones[posicion]
+        conservar = [numero for numero, actual in enumerate(self.estaciones) if actual != indice]
+        self.estaciones = array('i', [self.estaciones[numero] for numero in conservar])
+        valores = [self.valores[numero] for numero in conservar]
+        self.valores = array(self.valores.typecode, valores) if isinstance(self.valores, array) else valores
+        self._posiciones = None
+        return anterior
+
+    def items(self):
+        """Pares (idEstacion, valor) vigentes, uno por estación, en orden de aparición"""
+        ids = self.tabla_ids.ids
+        vistos = set()
+        for indice, valor in zip(self.estaciones, self.valores):
+            if indice not in vistos:
+                vistos.add(indice)
+                yield ids[indice], valor
+
+    def como_numpy(self):
+        """
+        Vistas NumPy sin copia de las dos columnas (requiere NumPy). Si los
+        valores no caben en 64 bits, la de valores es una copia de dtype object.
+        """
+        try:
+            import numpy as np
+        except ImportError:  # NumPy es opcional, solo agrega vistas sin copia de las columnas
+            raise ImportError("como_numpy requiere NumPy (pip install numpy)") from None
+        if not isinstance(self.valores, array):
+            return np.frombuffer(self.estaciones, dtype=np.int32), np.array(self.valores, dtype=object)
+        return (np.frombuffer(self.estaciones, dtype=np.int32),
+                np.frombuffer(self.valores, dtype=np.int32 if self.valores.typecode == 'i' else np.int64))
+
+    # Interfaz de la lista enlazada para el código que recorre sensor.frecuencias
+
+    def __iter__(self):
+        ids = self.tabla_ids.ids
+        for indice, valor in zip(self.estaciones, self.valores):
+            yield Frecuencia(ids[indice], valor)
+
+    def __len__(self):
+        return len(self.estaciones)
+
+    def esta_vacia(self):
+        return len(self.estaciones) == 0
+
+    def recorrer(self):
+        return list(self)
+
+    @property
+    def cabeza(self):
+        """Primer nodo de una lista enlazada armada en el momento (solo lectura)"""
+        lista = ListaEnlazada()
+        lista.extender(self)
+        return lista.cabeza
+
+
 class Estacion:
+    __slots__ = ("id", "nombre", "patron_suelo", "patron_cultivo")
+
     def __init__(self, id, nombre):
         self.id = id
         self.nombre = nombre
@@ -20,47 +192,56 @@ class Estacion:
         return f"Estacion {self.id}: {self.nombre}"
 
 
-class SensorSuelo:
-    def __init__(self, id, nombre):
+class Sensor:
+    """
+    Base común de los sensores de suelo y de cultivo.
+
+    Las frecuencias se guardan en columnas (FrecuenciasColumnares); el
+    sensor comparte la tabla de ids de su campo cuando se la pasan.
+    Si el archivo trae varias frecuencias para la misma estación, todas
+    quedan guardadas pero gana la primera (igual que la búsqueda lineal).
+    """
+
+    __slots__ = ("id", "nombre", "frecuencias")
+
+    def __init__(self, id, nombre, tabla_ids=None):
         self.id = id
         self.nombre = nombre
-        self.frecuencias = ListaEnlazada()
+        self.frecuencias = FrecuenciasColumnares(tabla_ids)
 
     def agregar_frecuencia(self, id_estacion, valor):
-        frecuencia = Frecuencia(id_estacion, valor)
-        self.frecuencias.insertar(frecuencia)
+        self.frecuencias.agregar(id_estacion, valor)
+
+    def agregar_frecuencias(self, ids_estacion, valores):
+        """Carga en bloque de frecuencias (listas paralelas de ids y valores)"""
+        self.frecuencias.agregar_lote(ids_estacion, valores)
 
     def obtener_frecuencia(self, id_estacion):
-        """Obtiene la frecuencia de forma eficiente para lista enlazada"""
-        actual = self.frecuencias.cabeza
-        while actual is not None:
-            if actual.dato.id_estacion == id_estacion:
-                return actual.dato.valor
-            actual = actual.siguiente
-        return 0
+        """Obtiene la frecuencia de una estación, 0 si no tiene registro"""
+        return self.frecuencias.obtener(id_estacion)
 
-    def __str__(self):
-        return f"Sensor Suelo {self.id}: {self.nombre}"
+    def actualizar_frecuencia(self, id_estacion, valor):
+        """Cambia el valor vigente de una estación (o lo agrega); devuelve el anterior"""
+        return self.frecuencias.actualizar(id_estacion, valor)
 
+    def eliminar_frecuencias(self, id_estacion):
+        """Quita todos los registros de una estación; devuelve el valor que estaba vigente"""
+        return self.frecuencias.eliminar(id_estacion)
 
-class SensorCultivo:
-    def __init__(self, id, nombre):
-        self.id = id
-        self.nombre = nombre
-        self.frecuencias = ListaEnlazada()
+    def items_frecuencia(self):
+        """Recorre los pares (idEstacion, valor) vigentes, uno por estación"""
+        return self.frecuencias.items()
 
-    def agregar_frecuencia(self, id_estacion, valor):
-        frecuencia = Frecuencia(id_estacion, valor)
-        self.frecuencias.insertar(frecuencia)
 
-    def obtener_frecuencia(self, id_estacion):
-        """Obtiene la frecuencia de forma eficiente para lista enlazada"""
-        actual = self.frecuencias.cabeza
-        while actual is not None:
-            if actual.dato.id_estacion == id_estacion:
-                return actual.dato.valor
-            actual = actual.siguiente
-        return 0
+class SensorSuelo(Sensor):
+    __slots__ = ()
+
+    def __str__(self):
+        return f"Sensor Suelo {self.id}: {self.nombre}"
+
+
+class SensorCultivo(Sensor):
+    __slots__ = ()
 
     def __str__(self):
         return f"Sensor Cultivo {self.id}: {self.nombre}"
@@ -74,42 +255,127 @@ class CampoAgricola:
         self.sensores_suelo = ListaEnlazada()
         self.sensores_cultivo = ListaEnlazada()
         self.grupos_estaciones = ListaEnlazada()
+        self.matriz_frecuencias = None
+        # Ids de estación internados que comparten las columnas de sus sensores;
+        # la posición en la tabla es el índice denso de cada estación
+        self.tabla_ids = TablaIds()
+
+        # Mapas id -> objeto (gana el primero con ese id, como la búsqueda lineal)
+        # e id -> columna de cada sensor, actualizados en agregar_*
+        self._estaciones_por_id = {}
+        self._sensores_suelo_por_id = {}
+        self._sensores_cultivo_por_id = {}
+        self._indice_sensores_suelo = {}
+        self._indice_sensores_cultivo = {}
+        # id -> estaciones que repiten un id ya usado (no agrupan, pero llevan sus patrones)
+        self._estaciones_repetidas = {}
+
+        # Estaciones modificadas desde el último procesamiento:
+        # idEstacion -> {sensor: cambio en su frecuencia vigente}
+        self.estaciones_sucias = {}
+        self.agrupamiento_incremental = None
 
     def agregar_estacion(self, estacion):
+        # El id queda internado: es la misma cadena que guarda la tabla del campo
+        estacion.id = self.tabla_ids[self.tabla_ids.indice(estacion.id)]
         self.estaciones.insertar(estacion)
+        if self._estaciones_por_id.setdefault(estacion.id, estacion) is not estacion:
+            self._estaciones_repetidas.setdefault(estacion.id, []).append(estacion)
+
+    def _marcar_sucia(self, id_estacion, sensor=None, cambio=0, al_final=False):
+        if al_final:
+            # Las estaciones nuevas quedan en el orden en que entraron a la lista
+            cambios = self.estaciones_sucias.pop(id_estacion, {})
+        else:
+            cambios = self.estaciones_sucias.get(id_estacion, {})
+        self.estaciones_sucias[id_estacion] = cambios
+        if sensor is not None and cambio:
+            cambios[sensor] = cambios.get(sensor, 0) + cambio
+
+    def insertar_estacion(self, estacion):
+        """Agrega una estación a un campo ya procesado y la marca para reprocesar"""
+        # Un id repetido no cambia el orden: sigue valiendo la primera estación
+        nueva = self.obtener_estacion_por_id(estacion.id) is None
+        self.agregar_estacion(estacion)
+        self._marcar_sucia(estacion.id, al_final=nueva)
+
+    def eliminar_estacion(self, id_estacion):
+        """Quita las estaciones con ese ID y sus frecuencias; devuelve si existía"""
+        existia = self.estaciones.eliminar_si(lambda estacion: estacion.id == id_estacion) > 0
+        self._estaciones_por_id.pop(id_estacion, None)
+        self._estaciones_repetidas.pop(id_estacion, None)
+        self._marcar_sucia(id_estacion)
+        for sensores in (self.sensores_suelo, self.sensores_cultivo):
+            for sensor in sensores:
+                anterior = sensor.eliminar_frecuencias(id_estacion)
+                self._marcar_sucia(id_estacion, sensor, -anterior)
+        return existia
+
+    def actualizar_frecuencia(self, id_sensor, id_estacion, valor, tipo="suelo"):
+        """Agrega o cambia la frecuencia de una estación en un sensor"""
+        if tipo == "suelo":
+            sensor = self.obtener_sensor_suelo_por_id(id_sensor)
+        else:
+            sensor = self.obtener_sensor_cultivo_por_id(id_sensor)
+        if sensor is None:
+            raise ValueError(f"No existe el sensor de {tipo} {id_sensor} en el campo {self.id}")
+        anterior = sensor.actualizar_frecuencia(id_estacion, valor)
+        self._marcar_sucia(id_estacion, sensor, valor - anterior)
 
     def agregar_sensor_suelo(self, sensor):
+        self._registrar_sensor(sensor, self._sensores_suelo_por_id, self._indice_sensores_suelo,
+                               len(self.sensores_suelo))
         self.sensores_suelo.insertar(sensor)
 
     def agregar_sensor_cultivo(self, sensor):
+        self._registrar_sensor(sensor, self._sensores_cultivo_por_id, self._indice_sensores_cultivo,
+                               len(self.sensores_cultivo))
         self.sensores_cultivo.insertar(sensor)
 
+    @staticmethod
+    def _registrar_sensor(sensor, por_id, indices, columna):
+        sensor.id = internar(sensor.id)
+        if sensor.id not in por_id:
+            por_id[sensor.id] = sensor
+            indices[sensor.id] = columna
+
     def obtener_estacion_por_id(self, id_estacion):
         """Obtiene una estación por su ID"""
-        actual = self.estaciones.cabeza
-        while actual is not None:
-            if actual.dato.id == id_estacion:
-                return actual.dato
-            actual = actual.siguiente
-        return None
+        return self._estaciones_por_id.get(id_estacion)
+
+    def obtener_estaciones_repetidas(self, id_estacion):
+        """Estaciones agregadas después de la primera con ese ID"""
+        return self._estaciones_repetidas.get(id_estacion, ())
 
     def obtener_sensor_suelo_por_id(self, id_sensor):
         """Obtiene un sensor de suelo por su ID"""
-        actual = self.sensores_suelo.cabeza
-        while actual is not None:
-            if actual.dato.id == id_sensor:
-                return actual.dato
-            actual = actual.siguiente
-        return None
+        return self._sensores_suelo_por_id.get(id_sensor)
 
     def obtener_sensor_cultivo_por_id(self, id_sensor):
         """Obtiene un sensor de cultivo por su ID"""
-        actual = self.sensores_cultivo.cabeza
-        while actual is not None:
-            if actual.dato.id == id_sensor:
-                return actual.dato
-            actual = actual.siguiente
-        return None
+        return self._sensores_cultivo_por_id.get(id_sensor)
+
+    def indice_estacion(self, id_estacion):
+        """Índice denso de la estación en la tabla de ids del campo, None si no existe"""
+        if id_estacion not in self._estaciones_por_id:
+            return None
+        return self.tabla_ids.buscar(id_estacion)
+
+    def indice_sensor_suelo(self, id_sensor):
+        """Columna del sensor de suelo (su posición en la lista), None si no existe"""
+        return self._indice_sensores_suelo.get(id_sensor)
+
+    def indice_sensor_cultivo(self, id_sensor):
+        """Columna del sensor de cultivo (su posición en la lista), None si no existe"""
+        return self._indice_sensores_cultivo.get(id_sensor)
+
+    def generar_matriz_frecuencias(self, dispersa=None):
+        """
+        Materializa la matriz estaciones x sensores del campo (requiere NumPy).
+        dispersa=None elige automáticamente entre matriz densa y dispersa.
+        """
+        from MatrizFrecuencias import MatrizFrecuencias
+        return MatrizFrecuencias(self, dispersa)
 
     def __str__(self):
         return f"Campo {self.id}: {self.nombre}"
@@ -123,6 +389,14 @@ class GrupoEstaciones:
         else:
             self.estaciones_lista = estaciones
 
+        self.actualizar_representante()
+
+        # Frecuencias reducidas por sensor (sensor -> total), calculadas una
+        # sola vez al procesar el campo; None mientras no se hayan calculado
+        self.frecuencias_totales = None
+
+    def actualizar_representante(self):
+        """Recalcula el id y el nombre representante tras cambiar las estaciones"""
         self.id_representante = self.estaciones_lista[0].id if self.estaciones_lista else ""
 
         # Construir nombre concatenado
@@ -141,6 +415,9 @@ class GrupoEstaciones:
         return elementos
 
     def obtener_frecuencia_total(self, sensor, tipo_sensor):
+        if self.frecuencias_totales is not None:
+            return self.frecuencias_totales.get(sensor, 0)
+
         total = 0
         for estacion in self.estaciones_lista:
             if tipo_sensor == "suelo":
@@ -158,4 +435,7 @@ class GrupoEstaciones:
 
     def __len__(self):
         """Número de estaciones en el grupo"""
-        return len(self.estaciones_lista)
\ No newline at end of file
+        return len(self.estaciones_lista)
+
+
+Instrumentacion.registrar_contador(Sensor, "obtener_frecuencia", "llamadas_obtener_frecuencia")
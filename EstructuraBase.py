@@ -1,4 +1,19 @@
+import sys
+
+import Instrumentacion
+
+# Marca para elementos sin atributo id (ningún id real es este objeto)
+_SIN_ID = object()
+
+
+def internar(valor):
+    """Interna las cadenas para que los ids repetidos compartan un solo objeto"""
+    return sys.intern(valor) if isinstance(valor, str) else valor
+
+
 class Nodo:
+    __slots__ = ("dato", "siguiente")
+
     def __init__(self, dato):
         self.dato = dato
         self.siguiente = None
@@ -10,19 +25,35 @@ class Nodo:
 class ListaEnlazada:
     def __init__(self):
         self.cabeza = None
+        self.cola = None
         self.longitud = 0
+        # Arreglo de nodos para acceso por posición; se arma al primer uso
+        self._cache_indices = None
 
     def insertar(self, dato):
-        """Inserta un nuevo elemento al final de la lista"""
+        """Inserta un nuevo elemento al final de la lista en O(1)"""
         nuevo_nodo = Nodo(dato)
         if self.cabeza is None:
             self.cabeza = nuevo_nodo
         else:
-            actual = self.cabeza
-            while actual.siguiente is not None:
-                actual = actual.siguiente
-            actual.siguiente = nuevo_nodo
+            self.cola.siguiente = nuevo_nodo
+        self.cola = nuevo_nodo
         self.longitud += 1
+        if self._cache_indices is not None:
+            self._cache_indices.append(nuevo_nodo)
+
+    def extender(self, iterable):
+        """Inserta al final todos los elementos de un iterable"""
+        for dato in iterable:
+            self.insertar(dato)
+
+    def __getstate__(self):
+        """Serializa la lista como arreglo plano (pickle no recorre nodo por nodo)"""
+        return {'datos': self.recorrer()}
+
+    def __setstate__(self, estado):
+        self.__init__()
+        self.extender(estado['datos'])
 
     def esta_vacia(self):
         """Verifica si la lista está vacía"""
@@ -52,45 +83,83 @@ class ListaEnlazada:
         """Busca un elemento por su atributo id"""
         actual = self.cabeza
         while actual is not None:
-            if hasattr(actual.dato, 'id') and actual.dato.id == id_buscar:
+            if getattr(actual.dato, 'id', _SIN_ID) == id_buscar:
                 return actual.dato
             actual = actual.siguiente
         return None
 
-    def obtener_por_indice(self, indice):
+    def obtener_por_indice(self, indice, usar_cache=True):
         """Obtiene el elemento en la posición especificada"""
         if indice < 0 or indice >= self.longitud:
             return None
 
+        if usar_cache:
+            if self._cache_indices is None:
+                self._construir_cache_indices()
+            return self._cache_indices[indice].dato
+
         actual = self.cabeza
         for i in range(indice):
             actual = actual.siguiente
         return actual.dato
 
+    def _construir_cache_indices(self):
+        """Arma el arreglo de nodos usado por obtener_por_indice"""
+        nodos = []
+        actual = self.cabeza
+        while actual is not None:
+            nodos.append(actual)
+            actual = actual.siguiente
+        self._cache_indices = nodos
+
     def eliminar_por_id(self, id_eliminar):
         """Elimina un elemento por su atributo id"""
         if self.esta_vacia():
             return False
 
-        # Caso especial: eliminar la cabeza
-        if hasattr(self.cabeza.dato, 'id') and self.cabeza.dato.id == id_eliminar:
-            self.cabeza = self.cabeza.siguiente
-            self.longitud -= 1
-            return True
-
         actual = self.cabeza
         anterior = None
 
         while actual is not None:
-            if hasattr(actual.dato, 'id') and actual.dato.id == id_eliminar:
-                anterior.siguiente = actual.siguiente
+            if getattr(actual.dato, 'id', _SIN_ID) == id_eliminar:
+                if anterior is None:
+                    self.cabeza = actual.siguiente
+                else:
+                    anterior.siguiente = actual.siguiente
+                if actual is self.cola:
+                    self.cola = anterior
                 self.longitud -= 1
+                self._cache_indices = None
                 return True
             anterior = actual
             actual = actual.siguiente
 
         return False
 
+    def eliminar_si(self, condicion):
+        """Elimina todos los elementos que cumplen la condición; devuelve cuántos"""
+        eliminados = 0
+        actual = self.cabeza
+        anterior = None
+
+        while actual is not None:
+            if condicion(actual.dato):
+                if anterior is None:
+                    self.cabeza = actual.siguiente
+                else:
+                    anterior.siguiente = actual.siguiente
+                if actual is self.cola:
+                    self.cola = anterior
+                self.longitud -= 1
+                eliminados += 1
+            else:
+                anterior = actual
+            actual = actual.siguiente
+
+        if eliminados:
+            self._cache_indices = None
+        return eliminados
+
     def __str__(self):
         """Representación en string de la lista"""
         elementos = []
@@ -102,61 +171,134 @@ class ListaEnlazada:
 
 
 
+class TablaIds:
+    """
+    Tabla de ids internados: cada id distinto se guarda una sola vez y se
+    identifica por su posición (índice denso 0..n-1).
+    """
+
+    __slots__ = ("ids", "posiciones")
+
+    def __init__(self):
+        self.ids = []
+        self.posiciones = {}
+
+    @classmethod
+    def desde_ids(cls, ids):
+        """Crea la tabla con ids ya distintos, cada uno en su posición"""
+        tabla = cls()
+        tabla.ids = [internar(id_estacion) for id_estacion in ids]
+        tabla.posiciones = {id_estacion: posicion for posicion, id_estacion in enumerate(tabla.ids)}
+        return tabla
+
+    def indice(self, id_buscar):
+        """Posición del id, agregándolo a la tabla si no estaba"""
+        posicion = self.posiciones.get(id_buscar)
+        if posicion is None:
+            id_buscar = internar(id_buscar)
+            posicion = len(self.ids)
+            self.posiciones[id_buscar] = posicion
+            self.ids.append(id_buscar)
+        return posicion
+
+    def indices(self, ids):
+        """Posiciones de varios ids a la vez"""
+        return [self.indice(id_buscar) for id_buscar in ids]
+
+    def buscar(self, id_buscar):
+        """Posición del id o None si no está en la tabla"""
+        return self.posiciones.get(id_buscar)
+
+    def __getitem__(self, posicion):
+        return self.ids[posicion]
+
+    def __len__(self):
+        return len(self.ids)
+
+
 class Patron:
-    """Clase para representar patrones sin usar tuplas nativas"""
+    """
+    Clase para representar patrones binarios sin usar tuplas nativas.
+    Los valores se empaquetan en un entero: el bit i corresponde al sensor i.
+    """
+
+    __slots__ = ("bits", "longitud")
 
     def __init__(self):
-        self.valores = ListaEnlazada()
+        self.bits = 0
+        self.longitud = 0
+
+    @classmethod
+    def desde_bits(cls, bits, longitud):
+        """Crea un patrón a partir de un entero ya empaquetado"""
+        patron = cls()
+        patron.bits = bits
+        patron.longitud = longitud
+        return patron
 
     def agregar_valor(self, valor):
         """Agrega un valor al patrón"""
-        self.valores.insertar(valor)
+        if valor:
+            self.bits |= 1 << self.longitud
+        self.longitud += 1
+
+    def obtener_valor(self, indice):
+        """Obtiene el valor (0 o 1) en la posición especificada"""
+        if indice < 0 or indice >= self.longitud:
+            return None
+        return (self.bits >> indice) & 1
 
     def es_igual(self, otro_patron):
         """Compara si dos patrones son iguales"""
         if otro_patron is None:
             return False
-        if self.valores.longitud != otro_patron.valores.longitud:
-            return False
+        return self.longitud == otro_patron.longitud and self.bits == otro_patron.bits
+
+    def __eq__(self, otro):
+        if not isinstance(otro, Patron):
+            return NotImplemented
+        return self.es_igual(otro)
+
+    def __hash__(self):
+        return hash((self.longitud, self.bits))
 
-        actual1 = self.valores.cabeza
-        actual2 = otro_patron.valores.cabeza
+    def clave(self):
+        """Devuelve una clave canónica y hashable que identifica al patrón"""
+        return (self.longitud, self.bits)
 
-        while actual1 is not None and actual2 is not None:
-            if actual1.dato != actual2.dato:
-                return False
-            actual1 = actual1.siguiente
-            actual2 = actual2.siguiente
+    def contar_unos(self):
+        """Cantidad de sensores activos en el patrón"""
+        return self.bits.bit_count()
 
-        return True
+    def distancia_hamming(self, otro_patron):
+        """Cantidad de posiciones en las que difieren dos patrones de igual longitud"""
+        if self.longitud != otro_patron.longitud:
+            raise ValueError("Los patrones deben tener la misma longitud")
+        return (self.bits ^ otro_patron.bits).bit_count()
 
     def clonar(self):
         """Crea una copia del patrón"""
-        nuevo_patron = Patron()
-        actual = self.valores.cabeza
-        while actual is not None:
-            nuevo_patron.agregar_valor(actual.dato)
-            actual = actual.siguiente
-        return nuevo_patron
+        return Patron.desde_bits(self.bits, self.longitud)
 
     def obtener_valores(self):
         """Obtiene los valores como lista"""
-        valores = []
-        actual = self.valores.cabeza
-        while actual is not None:
-            valores.append(actual.dato)
-            actual = actual.siguiente
-        return valores
+        bits = self.bits
+        return [(bits >> i) & 1 for i in range(self.longitud)]
+
+    @property
+    def valores(self):
+        """Vista de los valores como ListaEnlazada, para código que la recorre"""
+        lista = ListaEnlazada()
+        lista.extender(self.obtener_valores())
+        return lista
 
     def __str__(self):
         """Representación en string del patrón"""
-        valores = []
-        actual = self.valores.cabeza
-        while actual is not None:
-            valores.append(str(actual.dato))
-            actual = actual.siguiente
-        return "[" + ", ".join(valores) + "]"
+        return "[" + ", ".join(str(valor) for valor in self.obtener_valores()) + "]"
 
     def __len__(self):
         """Longitud del patrón"""
-        return self.valores.longitud
\ No newline at end of file
+        return self.longitud
+
+
+Instrumentacion.registrar_contador(Nodo, "siguiente", "nodos_recorridos")
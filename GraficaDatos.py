@@ -1,38 +1,150 @@
 from graphviz import Digraph
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import os
+import struct
+import zlib
 
-class GraficadoraDatos:
-    def __init__(self):
-        pass
+import Instrumentacion
+from Bitacora import registrar, registrar_error
+
+TIPOS_MATRIZ = ("frecuencias", "patrones", "reducida")
+FORMATOS = ("png", "svg")
+MODOS_GRANDE = ("mosaico", "raster")
+
+# Tipo de matriz -> (título, nombre del nodo de la tabla, formato de celda)
+_MATRICES = {"frecuencias": ("Matriz de Frecuencias", "matriz", "_celda_frecuencia"),
+             "patrones": ("Matriz de Patrones", "matriz_patrones", "_celda_patron"),
+             "reducida": ("Matriz Reducida", "matriz_reducida", "_celda_frecuencia")}
 
-    def generar_grafica(self, campo, tipo_matriz, nombre_archivo):
+
+class GraficadoraDatos:
+    def __init__(self, formato="png", usar_cache=True, max_celdas_tabla=20000,
+                 modo_grande="raster", escala_raster=4):
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato de gráfica no válido: {formato}")
+        if modo_grande not in MODOS_GRANDE:
+            raise ValueError(f"Modo para matrices grandes no válido: {modo_grande}")
+        self.formato = formato
+        # Si el DOT no cambió y la imagen existe, no se vuelve a llamar a Graphviz
+        self.usar_cache = usar_cache
+        # Por encima de este tamaño la matriz se dibuja como mapa de calor PNG
+        # ("raster") o se parte en mosaicos, un grafo y un archivo por parte.
+        # El costo de Graphviz crece con las celdas, así que los mosaicos
+        # acotan cada render pero no el total; en SVG siempre hay mosaicos
+        self.max_celdas_tabla = max_celdas_tabla
+        self.modo_grande = modo_grande
+        self.escala_raster = escala_raster
+
+    def construir_dots(self, campo, tipo_matriz):
+        """
+        Arma los grafos DOT de una matriz como lista de (sufijo, Digraph); None
+        si el tipo no es válido. Si la matriz entra en una tabla hay un solo
+        grafo con sufijo ""; si no, uno por mosaico con sufijo "_parte_<k>".
+        """
+        if tipo_matriz not in _MATRICES:
+            return None
+        titulo, nombre_nodo, celda = _MATRICES[tipo_matriz]
+        titulo = f'{titulo} - Campo {campo.nombre}'
+
+        datos = self._datos_matriz(campo, tipo_matriz)
+        if datos is None:
+            dot = self._nuevo_dot(campo, tipo_matriz, titulo)
+            if tipo_matriz == "reducida":
+                dot.node('error', label='No hay grupos reducidos. Ejecute "Procesar archivo" primero.', shape='box')
+            return [("", dot)]
+
+        tablas = list(self._tablas_html(datos, getattr(self, celda)))
+        if len(tablas) == 1:
+            dot = self._nuevo_dot(campo, tipo_matriz, titulo)
+            dot.node(nombre_nodo, label=tablas[0], shape='none')
+            return [("", dot)]
+
+        dots = []
+        for numero, tabla in enumerate(tablas, 1):
+            parte = f' (parte {numero} de {len(tablas)})'
+            dot = self._nuevo_dot(campo, tipo_matriz, titulo + parte, parte)
+            dot.node(f'{nombre_nodo}_{numero}', label=tabla, shape='none')
+            dots.append((f"_parte_{numero}", dot))
+        return dots
+
+    @staticmethod
+    def _nuevo_dot(campo, tipo_matriz, titulo, parte=""):
+        dot = Digraph(comment=f'Matriz {tipo_matriz} - Campo {campo.id}{parte}')
+        dot.attr(rankdir='TB')  # Top to Bottom orientation
+        dot.attr(label=f'{titulo}\n\n')
+        return dot
+
+    def generar_grafica(self, campo, tipo_matriz, nombre_archivo, formato=None):
         """Método principal para generar gráficas"""
+        formato = formato or self.formato
+        with Instrumentacion.medir("generar_grafica"):
+            return self._generar_grafica(campo, tipo_matriz, nombre_archivo, formato)
+
+    def _generar_grafica(self, campo, tipo_matriz, nombre_archivo, formato):
         try:
-            dot = Digraph(comment=f'Matriz {tipo_matriz} - Campo {campo.id}')
-            dot.attr(rankdir='TB')  # Top to Bottom orientation
-
-            if tipo_matriz == "frecuencias":
-                self._graficar_matriz_frecuencias(dot, campo)
-            elif tipo_matriz == "patrones":
-                self._graficar_matriz_patrones(dot, campo)
-            elif tipo_matriz == "reducida":
-                self._graficar_matriz_reducida(dot, campo)
-            else:
-                print("❌ Tipo de matriz no válido")
+            if tipo_matriz in TIPOS_MATRIZ and self._usar_raster(campo, tipo_matriz, formato):
+                self.escribir_mapa_calor(campo, tipo_matriz, nombre_archivo)
+                registrar(f"✅ Gráfica {tipo_matriz} generada como mapa de calor: {nombre_archivo}.png")
+                return True
+
+            dots = self.construir_dots(campo, tipo_matriz)
+            if dots is None:
+                registrar_error("❌ Tipo de matriz no válido")
                 return False
 
-            # Asegurar que la ruta existe
-            if os.path.dirname(nombre_archivo):
-                os.makedirs(os.path.dirname(nombre_archivo), exist_ok=True)
+            if len(dots) == 1:
+                self._renderizar(dots[0][1], nombre_archivo, formato)
+                registrar(f"✅ Gráfica {tipo_matriz} generada: {nombre_archivo}.{formato}")
+                return True
 
-            dot.render(nombre_archivo, format='png', cleanup=True)
-            print(f"✅ Gráfica {tipo_matriz} generada: {nombre_archivo}.png")
-            return True
+            # Mosaicos: cada parte es un archivo y un render de Graphviz aparte
+            with LoteGraficas(self, formato) as lote:
+                lote.agregar_dots(dots, nombre_archivo)
+                resultados = lote.esperar()
+            return all(exito for _, exito in resultados)
 
         except Exception as e:
-            print(f"❌ Error al generar gráfica: {e}")
+            registrar_error(f"❌ Error al generar gráfica: {e}")
             return False
 
+    def generar_graficas(self, campos, tipos_matriz=TIPOS_MATRIZ, directorio=".",
+                         plantilla="grafica_{campo}_{tipo}", formato=None, max_workers=None):
+        """
+        Genera varias gráficas a la vez. Los DOT se arman en este hilo y las
+        llamadas a Graphviz (un subproceso cada una) corren en un pool de hilos.
+        La plantilla del nombre recibe {campo} (id del campo) y {tipo}.
+        Devuelve una lista de (nombre_archivo, exito) en el orden de los trabajos.
+        """
+        with LoteGraficas(self, formato, max_workers) as lote:
+            lote.agregar(campos, tipos_matriz, directorio, plantilla)
+            return lote.esperar()
+
+    def _renderizar(self, dot, nombre_archivo, formato):
+        """
+        Llama a Graphviz, salvo que ya exista la imagen de este mismo DOT.
+        El hash del DOT se guarda junto a la imagen en <nombre>.<formato>.sha256.
+        """
+        ruta_imagen = f"{nombre_archivo}.{formato}"
+        ruta_hash = f"{ruta_imagen}.sha256"
+        huella = hashlib.sha256(dot.source.encode("utf-8")).hexdigest()
+
+        if self.usar_cache and os.path.exists(ruta_imagen) and os.path.exists(ruta_hash):
+            with open(ruta_hash, encoding="utf-8") as archivo:
+                if archivo.read().strip() == huella:
+                    return False
+
+        # Asegurar que la ruta existe
+        if os.path.dirname(nombre_archivo):
+            os.makedirs(os.path.dirname(nombre_archivo), exist_ok=True)
+
+        dot.render(nombre_archivo, format=formato, cleanup=True)
+        if self.usar_cache:
+            with open(ruta_hash, "w", encoding="utf-8") as archivo:
+                archivo.write(huella)
+        return True
+
     def _contar_sensores(self, lista_sensores):
         """Cuenta la cantidad de sensores en una lista enlazada"""
         count = 0
@@ -53,187 +165,267 @@ class GraficadoraDatos:
 
     def _obtener_valores_patron(self, patron):
         """Obtiene los valores de un patrón como lista"""
-        valores = []
-        if patron and hasattr(patron, 'valores'):
-            actual = patron.valores.cabeza
-            while actual is not None:
-                valores.append(actual.dato)
-                actual = actual.siguiente
-        return valores
-
-    def _graficar_matriz_frecuencias(self, dot, campo):
-        """Genera gráfica de matriz de frecuencias originales"""
-        dot.attr(label=f'Matriz de Frecuencias - Campo {campo.nombre}\n\n')
-
-        # Obtener listas de sensores
-        sensores_suelo = self._obtener_lista_sensores(campo.sensores_suelo)
-        sensores_cultivo = self._obtener_lista_sensores(campo.sensores_cultivo)
-
-        # Tabla HTML para mejor formato
-        tabla_html = '''<
-        <TABLE BORDER="1" CELLBORDER="1" CELLSPACING="0">
-        <TR>
-            <TD BGCOLOR="lightblue"><B>Estación/Sensor</B></TD>'''
-
-        # Encabezados de sensores de suelo
-        for sensor in sensores_suelo:
-            tabla_html += f'<TD BGCOLOR="lightgreen"><B>{sensor.id}</B></TD>'
-
-        # Encabezados de sensores de cultivo
-        for sensor in sensores_cultivo:
-            tabla_html += f'<TD BGCOLOR="lightyellow"><B>{sensor.id}</B></TD>'
-
-        tabla_html += '</TR>'
-
-        # Filas para cada estación
-        actual_estacion = campo.estaciones.cabeza
-        while actual_estacion is not None:
-            estacion = actual_estacion.dato
-            tabla_html += f'<TR><TD BGCOLOR="lightblue"><B>{estacion.id}</B></TD>'
-
-            # Valores para sensores de suelo
-            for sensor in sensores_suelo:
-                frecuencia = sensor.obtener_frecuencia(estacion.id)
-                color = "white" if frecuencia == 0 else "palegreen"
-                tabla_html += f'<TD BGCOLOR="{color}">{frecuencia}</TD>'
-
-            # Valores para sensores de cultivo
-            for sensor in sensores_cultivo:
-                frecuencia = sensor.obtener_frecuencia(estacion.id)
-                color = "white" if frecuencia == 0 else "lightyellow"
-                tabla_html += f'<TD BGCOLOR="{color}">{frecuencia}</TD>'
-
-            tabla_html += '</TR>'
-            actual_estacion = actual_estacion.siguiente
-
-        tabla_html += '</TABLE>>'
-
-        dot.node('matriz', label=tabla_html, shape='none')
-
-    def _graficar_matriz_patrones(self, dot, campo):
-        """Genera gráfica de matriz de patrones binarios"""
-        dot.attr(label=f'Matriz de Patrones - Campo {campo.nombre}\n\n')
-
-        # Calcular patrones si no están calculados
-        if not hasattr(campo.estaciones.cabeza.dato,
-                       'patron_suelo') or campo.estaciones.cabeza.dato.patron_suelo is None:
-            try:
-                from CargarProcesarSalidaDatos import calcular_patrones_estaciones
-                calcular_patrones_estaciones(campo)
-            except ImportError:
-                print("❌ No se pudo importar calcular_patrones_estaciones")
-                return
-
-        # Obtener listas de sensores
+        if patron is None:
+            return []
+        return patron.obtener_valores()
+
+    def _datos_matriz(self, campo, tipo_matriz):
+        """
+        Devuelve (esquina, sensores_suelo, sensores_cultivo, num_filas, filas)
+        donde filas es un generador de (etiqueta, valores_suelo, valores_cultivo).
+        Las filas se producen de a una para no materializar la matriz completa.
+        """
         sensores_suelo = self._obtener_lista_sensores(campo.sensores_suelo)
         sensores_cultivo = self._obtener_lista_sensores(campo.sensores_cultivo)
 
-        total_sensores = len(sensores_suelo) + len(sensores_cultivo)
-
-        tabla_html = '''<
+        if tipo_matriz == "frecuencias":
+            def filas():
+                for estacion in campo.estaciones:
+                    yield (estacion.id,
+                           [sensor.obtener_frecuencia(estacion.id) for sensor in sensores_suelo],
+                           [sensor.obtener_frecuencia(estacion.id) for sensor in sensores_cultivo])
+            return 'Estación/Sensor', sensores_suelo, sensores_cultivo, len(campo.estaciones), filas()
+
+        if tipo_matriz == "patrones":
+            # Calcular patrones si no están calculados
+            if not hasattr(campo.estaciones.cabeza.dato,
+                           'patron_suelo') or campo.estaciones.cabeza.dato.patron_suelo is None:
+                try:
+                    from CargarProcesarSalidaDatos import calcular_patrones_estaciones
+                    calcular_patrones_estaciones(campo)
+                except ImportError:
+                    registrar_error("❌ No se pudo importar calcular_patrones_estaciones")
+                    return None
+
+            def completar(valores, cantidad):
+                return [valores[i] if i < len(valores) else 0 for i in range(cantidad)]
+
+            def filas():
+                for estacion in campo.estaciones:
+                    yield (estacion.id,
+                           completar(self._obtener_valores_patron(estacion.patron_suelo), len(sensores_suelo)),
+                           completar(self._obtener_valores_patron(estacion.patron_cultivo), len(sensores_cultivo)))
+            return 'Estación/Sensor', sensores_suelo, sensores_cultivo, len(campo.estaciones), filas()
+
+        if tipo_matriz == "reducida":
+            if campo.grupos_estaciones.esta_vacia():
+                return None
+
+            def filas():
+                for grupo in campo.grupos_estaciones:
+                    yield (grupo.id_representante,
+                           [grupo.obtener_frecuencia_total(sensor, "suelo") for sensor in sensores_suelo],
+                           [grupo.obtener_frecuencia_total(sensor, "cultivo") for sensor in sensores_cultivo])
+            return 'Grupo/Sensor', sensores_suelo, sensores_cultivo, len(campo.grupos_estaciones), filas()
+
+        raise ValueError(f"Tipo de matriz no válido: {tipo_matriz}")
+
+    @staticmethod
+    def _celda_frecuencia(valor, es_suelo):
+        if valor == 0:
+            return f'<TD BGCOLOR="white">{valor}</TD>'
+        return f'<TD BGCOLOR="{"palegreen" if es_suelo else "lightyellow"}">{valor}</TD>'
+
+    @staticmethod
+    def _celda_patron(valor, es_suelo):
+        if valor == 0:
+            return '<TD BGCOLOR="red"><FONT COLOR="white">0</FONT></TD>'
+        return '<TD BGCOLOR="green"><FONT COLOR="white">1</FONT></TD>'
+
+    def _tablas_html(self, datos, formato_celda):
+        """
+        Genera las etiquetas HTML de la matriz uniendo fragmentos con join. Si
+        la matriz supera max_celdas_tabla se parte en varias tablas (mosaicos),
+        cada una con su encabezado.
+        """
+        esquina, sensores_suelo, sensores_cultivo, num_filas, filas = datos
+
+        encabezado = ['''<
         <TABLE BORDER="1" CELLBORDER="1" CELLSPACING="0">
         <TR>
-            <TD BGCOLOR="lightblue"><B>Estación/Sensor</B></TD>'''
-
-        # Encabezados de sensores
+            <TD BGCOLOR="lightblue"><B>''', esquina, '</B></TD>']
         for sensor in sensores_suelo:
-            tabla_html += f'<TD BGCOLOR="lightgreen"><B>{sensor.id}</B></TD>'
-
+            encabezado.append(f'<TD BGCOLOR="lightgreen"><B>{sensor.id}</B></TD>')
         for sensor in sensores_cultivo:
-            tabla_html += f'<TD BGCOLOR="lightyellow"><B>{sensor.id}</B></TD>'
-
-        tabla_html += '</TR>'
-
-        # Filas para cada estación
-        actual_estacion = campo.estaciones.cabeza
-        while actual_estacion is not None:
-            estacion = actual_estacion.dato
-            tabla_html += f'<TR><TD BGCOLOR="lightblue"><B>{estacion.id}</B></TD>'
-
-            # Valores de patrones
-            valores_suelo = self._obtener_valores_patron(estacion.patron_suelo)
-            valores_cultivo = self._obtener_valores_patron(estacion.patron_cultivo)
-
-            # Patrones de suelo
-            for i in range(len(sensores_suelo)):
-                valor = valores_suelo[i] if i < len(valores_suelo) else 0
-                color = "red" if valor == 0 else "green"
-                texto = "0" if valor == 0 else "1"
-                tabla_html += f'<TD BGCOLOR="{color}"><FONT COLOR="white">{texto}</FONT></TD>'
-
-            # Patrones de cultivo
-            for i in range(len(sensores_cultivo)):
-                valor = valores_cultivo[i] if i < len(valores_cultivo) else 0
-                color = "red" if valor == 0 else "green"
-                texto = "0" if valor == 0 else "1"
-                tabla_html += f'<TD BGCOLOR="{color}"><FONT COLOR="white">{texto}</FONT></TD>'
-
-            tabla_html += '</TR>'
-            actual_estacion = actual_estacion.siguiente
-
-        tabla_html += '</TABLE>>'
-
-        dot.node('matriz_patrones', label=tabla_html, shape='none')
-
-    def _graficar_matriz_reducida(self, dot, campo):
-        """Genera gráfica de matriz reducida después del agrupamiento"""
-        dot.attr(label=f'Matriz Reducida - Campo {campo.nombre}\n\n')
-
-        if campo.grupos_estaciones.esta_vacia():
-            dot.node('error', label='No hay grupos reducidos. Ejecute "Procesar archivo" primero.', shape='box')
+            encabezado.append(f'<TD BGCOLOR="lightyellow"><B>{sensor.id}</B></TD>')
+        encabezado.append('</TR>')
+        encabezado = "".join(encabezado)
+
+        columnas = 1 + len(sensores_suelo) + len(sensores_cultivo)
+        filas_por_tabla = max(1, self.max_celdas_tabla // columnas)
+        en_mosaicos = num_filas > filas_por_tabla
+
+        partes = [encabezado]
+        filas_en_tabla = 0
+        for etiqueta, valores_suelo, valores_cultivo in filas:
+            partes.append(f'<TR><TD BGCOLOR="lightblue"><B>{etiqueta}</B></TD>')
+            partes.extend(formato_celda(valor, True) for valor in valores_suelo)
+            partes.extend(formato_celda(valor, False) for valor in valores_cultivo)
+            partes.append('</TR>')
+            filas_en_tabla += 1
+
+            if en_mosaicos and filas_en_tabla == filas_por_tabla:
+                partes.append('</TABLE>>')
+                yield "".join(partes)
+                partes = [encabezado]
+                filas_en_tabla = 0
+
+        if not en_mosaicos or filas_en_tabla:
+            partes.append('</TABLE>>')
+            yield "".join(partes)
+
+    def contar_celdas(self, campo, tipo_matriz):
+        """Cantidad de celdas de la tabla que se generaría"""
+        columnas = 1 + len(campo.sensores_suelo) + len(campo.sensores_cultivo)
+        if tipo_matriz == "reducida":
+            return len(campo.grupos_estaciones) * columnas
+        return len(campo.estaciones) * columnas
+
+    def _usar_raster(self, campo, tipo_matriz, formato):
+        return (self.modo_grande == "raster" and formato == "png" and
+                self.contar_celdas(campo, tipo_matriz) > self.max_celdas_tabla)
+
+    def escribir_mapa_calor(self, campo, tipo_matriz, nombre_archivo):
+        """
+        Escribe directamente un PNG (sin Graphviz) con un píxel por celda,
+        ampliado según escala_raster. Las frecuencias se pintan con intensidad
+        proporcional al máximo de su tipo de sensor; los patrones en rojo/verde.
+        """
+        datos = self._datos_matriz(campo, tipo_matriz)
+        if datos is None:
+            raise ValueError("No hay datos para la matriz solicitada")
+        _, sensores_suelo, sensores_cultivo, num_filas, filas = datos
+        num_suelo = len(sensores_suelo)
+        ancho = num_suelo + len(sensores_cultivo)
+
+        # Valores en un arreglo compacto (8 bytes por celda)
+        valores = array('q')
+        for _, valores_suelo, valores_cultivo in filas:
+            valores.extend(valores_suelo)
+            valores.extend(valores_cultivo)
+
+        escala = self.escala_raster
+        if tipo_matriz == "patrones":
+            paleta_suelo = paleta_cultivo = [bytes((255, 0, 0)) * escala, bytes((0, 128, 0)) * escala]
+            maximo_suelo = maximo_cultivo = 1
+        else:
+            maximo_suelo = max((max(valores[inicio:inicio + num_suelo], default=0)
+                                for inicio in range(0, len(valores), ancho)), default=0) or 1
+            maximo_cultivo = max((max(valores[inicio + num_suelo:inicio + ancho], default=0)
+                                  for inicio in range(0, len(valores), ancho)), default=0) or 1
+            # 256 niveles de intensidad; el nivel 0 es blanco
+            paleta_suelo = [bytes((255 - nivel, 255 - nivel * 100 // 255, 255 - nivel)) * escala
+                            for nivel in range(256)]
+            paleta_cultivo = [bytes((255, 255 - nivel * 90 // 255, 255 - nivel)) * escala
+                              for nivel in range(256)]
+
+        def niveles(segmento, maximo):
+            if tipo_matriz == "patrones":
+                return [1 if valor else 0 for valor in segmento]
+            return [valor * 255 // maximo if valor > 0 else 0 for valor in segmento]
+
+        def filas_rgb():
+            for inicio in range(0, len(valores), ancho):
+                fila = (b"".join([paleta_suelo[nivel] for nivel in
+                                  niveles(valores[inicio:inicio + num_suelo], maximo_suelo)]) +
+                        b"".join([paleta_cultivo[nivel] for nivel in
+                                  niveles(valores[inicio + num_suelo:inicio + ancho], maximo_cultivo)]))
+                for _ in range(escala):
+                    yield fila
+
+        if os.path.dirname(nombre_archivo):
+            os.makedirs(os.path.dirname(nombre_archivo), exist_ok=True)
+        escribir_png(f"{nombre_archivo}.png", ancho * escala, num_filas * escala, filas_rgb())
+
+
+def escribir_png(ruta, ancho, alto, filas_rgb):
+    """Escribe un PNG RGB de 8 bits a partir de un iterable de filas de bytes"""
+    def bloque(tipo, datos):
+        return (struct.pack(">I", len(datos)) + tipo + datos +
+                struct.pack(">I", zlib.crc32(tipo + datos) & 0xffffffff))
+
+    compresor = zlib.compressobj(6)
+    comprimido = []
+    for fila in filas_rgb:
+        # Filtro 0 (ninguno) al inicio de cada fila
+        comprimido.append(compresor.compress(b"\x00" + fila))
+    comprimido.append(compresor.flush())
+
+    with open(ruta, "wb") as archivo:
+        archivo.write(b"\x89PNG\r\n\x1a\n")
+        archivo.write(bloque(b"IHDR", struct.pack(">IIBBBBB", max(ancho, 1), max(alto, 1), 8, 2, 0, 0, 0)))
+        archivo.write(bloque(b"IDAT", b"".join(comprimido)))
+        archivo.write(bloque(b"IEND", b""))
+
+
+class LoteGraficas:
+    """
+    Pool de hilos compartido para renderizar gráficas de varios campos. Cada
+    llamada a agregar() arma los DOT en el hilo actual y encola los renders,
+    así las gráficas de un campo se generan mientras se avanza con el
+    siguiente; una matriz en mosaicos encola un render por parte.
+    esperar() devuelve (nombre_archivo, exito) en orden de llegada.
+    """
+
+    def __init__(self, graficadora, formato=None, max_workers=None):
+        self.graficadora = graficadora
+        self.formato = formato or graficadora.formato
+        if self.formato not in FORMATOS:
+            raise ValueError(f"Formato de gráfica no válido: {self.formato}")
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.futuros = []
+
+    def agregar(self, campos, tipos_matriz=TIPOS_MATRIZ, directorio=".",
+                plantilla="grafica_{campo}_{tipo}"):
+        """Encola las gráficas de los campos; la plantilla recibe {campo} y {tipo}"""
+        for campo in campos:
+            for tipo_matriz in tipos_matriz:
+                nombre = os.path.join(directorio, plantilla.format(campo=campo.id, tipo=tipo_matriz))
+                self.agregar_grafica(campo, tipo_matriz, nombre)
+
+    def agregar_grafica(self, campo, tipo_matriz, nombre):
+        """Encola una gráfica; en mosaicos, un archivo <nombre>_parte_<k> por parte"""
+        if self.graficadora._usar_raster(campo, tipo_matriz, self.formato):
+            # El mapa de calor se escribe sin Graphviz, en el pool
+            self.futuros.append(self.executor.submit(self._renderizar, None, nombre, campo, tipo_matriz))
             return
-
-        # Obtener listas de sensores
-        sensores_suelo = self._obtener_lista_sensores(campo.sensores_suelo)
-        sensores_cultivo = self._obtener_lista_sensores(campo.sensores_cultivo)
-
-        tabla_html = '''<
-        <TABLE BORDER="1" CELLBORDER="1" CELLSPACING="0">
-        <TR>
-            <TD BGCOLOR="lightblue"><B>Grupo/Sensor</B></TD>'''
-
-        # Encabezados de sensores
-        for sensor in sensores_suelo:
-            tabla_html += f'<TD BGCOLOR="lightgreen"><B>{sensor.id}</B></TD>'
-
-        for sensor in sensores_cultivo:
-            tabla_html += f'<TD BGCOLOR="lightyellow"><B>{sensor.id}</B></TD>'
-
-        tabla_html += '</TR>'
-
-        # Filas para cada grupo
-        actual_grupo = campo.grupos_estaciones.cabeza
-        while actual_grupo is not None:
-            grupo = actual_grupo.dato
-            tabla_html += f'<TR><TD BGCOLOR="lightblue"><B>{grupo.id_representante}</B></TD>'
-
-            # Valores para sensores de suelo
-            for sensor in sensores_suelo:
-                frecuencia_total = 0
-                actual_estacion = grupo.estaciones.cabeza
-                while actual_estacion is not None:
-                    estacion = actual_estacion.dato
-                    frecuencia_total += sensor.obtener_frecuencia(estacion.id)
-                    actual_estacion = actual_estacion.siguiente
-
-                color = "white" if frecuencia_total == 0 else "palegreen"
-                tabla_html += f'<TD BGCOLOR="{color}">{frecuencia_total}</TD>'
-
-            # Valores para sensores de cultivo
-            for sensor in sensores_cultivo:
-                frecuencia_total = 0
-                actual_estacion = grupo.estaciones.cabeza
-                while actual_estacion is not None:
-                    estacion = actual_estacion.dato
-                    frecuencia_total += sensor.obtener_frecuencia(estacion.id)
-                    actual_estacion = actual_estacion.siguiente
-
-                color = "white" if frecuencia_total == 0 else "lightyellow"
-                tabla_html += f'<TD BGCOLOR="{color}">{frecuencia_total}</TD>'
-
-            tabla_html += '</TR>'
-            actual_grupo = actual_grupo.siguiente
-
-        tabla_html += '</TABLE>>'
-
-        dot.node('matriz_reducida', label=tabla_html, shape='none')
\ No newline at end of file
+        dots = self.graficadora.construir_dots(campo, tipo_matriz)
+        if dots is None:
+            raise ValueError(f"Tipo de matriz no válido: {tipo_matriz}")
+        self.agregar_dots(dots, nombre, campo, tipo_matriz)
+
+    def agregar_dots(self, dots, nombre, campo=None, tipo_matriz=None):
+        """Encola los (sufijo, Digraph) que devuelve construir_dots"""
+        for sufijo, dot in dots:
+            self.futuros.append(self.executor.submit(self._renderizar, dot, nombre + sufijo,
+                                                     campo, tipo_matriz))
+
+    def _renderizar(self, dot, nombre, campo, tipo_matriz):
+        try:
+            if dot is None:
+                self.graficadora.escribir_mapa_calor(campo, tipo_matriz, nombre)
+            else:
+                self.graficadora._renderizar(dot, nombre, self.formato)
+            return nombre, True
+        except Exception as e:
+            registrar_error(f"❌ Error al generar gráfica {nombre}: {e}")
+            return nombre, False
+
+    def esperar(self):
+        """Espera todos los renders encolados y devuelve sus resultados"""
+        resultados = [futuro.result() for futuro in self.futuros]
+        self.futuros = []
+        exitosas = sum(1 for _, exito in resultados if exito)
+        registrar(f"✅ {exitosas} de {len(resultados)} gráficas generadas en formato {self.formato}")
+        return resultados
+
+    def cerrar(self):
+        # Si se sale por un error, los renders que no empezaron se descartan
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_error, error, traza):
+        self.cerrar()
+        return False
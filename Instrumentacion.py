@@ -0,0 +1,221 @@
+"""
+Tiempos por etapa y contadores del procesamiento.
+
+Apagada por defecto. Se enciende con activar() (el modo por lotes lo hace con
+--instrumentar) o con la variable de entorno AGRO_INSTRUMENTACION=1; si además
+existe AGRO_INSTRUMENTACION_REPORTE=ruta.json, el reporte se guarda al salir.
+
+Apagada no cuesta nada: medir() devuelve un contexto vacío y los contadores
+de las funciones muy llamadas (obtener_frecuencia, nodos recorridos, etc.)
+solo se instalan, envolviendo el atributo original, mientras está activa.
+"""
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+
+activa = False
+
+_NULO = contextlib.nullcontext()
+_ganchos = []          # (objeto, atributo, contador) registrados por los módulos
+_originales = {}       # (id(objeto), atributo) -> valor original mientras está activa
+_contadores = {}
+_etapas = {}
+_campos = []
+_hilo = threading.local()  # campo en proceso de cada hilo (el pipeline usa varios)
+_inicio = None
+
+
+def registrar_contador(objeto, atributo, contador):
+    """
+    Declara que cada uso de objeto.atributo suma 1 a contador. Sirve para
+    funciones y métodos (cuenta llamadas) y para slots (cuenta lecturas).
+    """
+    _ganchos.append((objeto, atributo, contador))
+    if activa:
+        _instalar(objeto, atributo, contador)
+
+
+def _instalar(objeto, atributo, contador):
+    original = objeto.__dict__[atributo] if isinstance(objeto, type) else getattr(objeto, atributo)
+    _originales[(id(objeto), atributo)] = (objeto, original)
+
+    if hasattr(original, "__set__"):
+        # Slot de __slots__: se cuenta cada lectura del atributo
+        def leer(instancia):
+            _contadores[contador] = _contadores.get(contador, 0) + 1
+            return original.__get__(instancia, objeto)
+
+        def escribir(instancia, valor):
+            original.__set__(instancia, valor)
+
+        setattr(objeto, atributo, property(leer, escribir))
+        return
+
+    def envoltura(*argumentos, **opciones):
+        _contadores[contador] = _contadores.get(contador, 0) + 1
+        return original(*argumentos, **opciones)
+
+    envoltura.__wrapped__ = original
+    setattr(objeto, atributo, envoltura)
+
+
+def _desinstalar():
+    for (_, atributo), (objeto, original) in _originales.items():
+        setattr(objeto, atributo, original)
+    _originales.clear()
+
+
+def activar(encender=True):
+    """Enciende (o apaga) la instrumentación"""
+    global activa, _inicio
+    if encender == activa:
+        return
+    activa = encender
+    if encender:
+        _inicio = time.perf_counter()
+        for objeto, atributo, contador in _ganchos:
+            _instalar(objeto, atributo, contador)
+    else:
+        _desinstalar()
+
+
+def reiniciar():
+    """Borra los tiempos y contadores acumulados"""
+    global _inicio
+    _contadores.clear()
+    _etapas.clear()
+    _campos.clear()
+    _hilo.campo = None
+    _inicio = time.perf_counter() if activa else None
+
+
+def sumar(contador, cantidad=1):
+    """Suma a un contador (llamar solo con la instrumentación activa)"""
+    _contadores[contador] = _contadores.get(contador, 0) + cantidad
+
+
+def _acumular(etapas, nombre, segundos, segundos_cpu):
+    registro = etapas.get(nombre)
+    if registro is None:
+        registro = etapas[nombre] = {"llamadas": 0, "segundos": 0.0, "segundos_cpu": 0.0}
+    registro["llamadas"] += 1
+    registro["segundos"] += segundos
+    registro["segundos_cpu"] += segundos_cpu
+
+
+@contextlib.contextmanager
+def _medir(nombre):
+    inicio = time.perf_counter()
+    inicio_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        segundos_cpu = time.process_time() - inicio_cpu
+        _acumular(_etapas, nombre, segundos, segundos_cpu)
+        campo_actual = getattr(_hilo, "campo", None)
+        if campo_actual is not None:
+            _acumular(campo_actual["etapas"], nombre, segundos, segundos_cpu)
+
+
+def medir(nombre):
+    """Contexto que mide tiempo de reloj y de CPU de una etapa"""
+    if not activa:
+        return _NULO
+    return _medir(nombre)
+
+
+@contextlib.contextmanager
+def _medir_campo(campo):
+    anterior = getattr(_hilo, "campo", None)
+    contadores_antes = dict(_contadores)
+    registro = {
+        "id": campo.id,
+        "estaciones": len(campo.estaciones),
+        "sensores": len(campo.sensores_suelo) + len(campo.sensores_cultivo),
+        "frecuencias": sum(len(sensor.frecuencias)
+                           for sensores in (campo.sensores_suelo, campo.sensores_cultivo)
+                           for sensor in sensores),
+        "etapas": {},
+    }
+    _campos.append(registro)
+    _hilo.campo = registro
+    try:
+        with _medir("procesar_campo"):
+            yield registro
+    finally:
+        _hilo.campo = anterior
+        registro["grupos"] = len(campo.grupos_estaciones)
+        registro["contadores"] = {nombre: valor - contadores_antes.get(nombre, 0)
+                                  for nombre, valor in _contadores.items()
+                                  if valor != contadores_antes.get(nombre, 0)}
+
+
+def medir_campo(campo):
+    """Contexto para el procesamiento de un campo: sus etapas y contadores van a su propio registro"""
+    if not activa:
+        return _NULO
+    return _medir_campo(campo)
+
+
+def exportar():
+    """Lo medido hasta ahora, en tipos simples, para mandarlo desde un proceso hijo"""
+    return {
+        "etapas": {nombre: dict(registro) for nombre, registro in _etapas.items()},
+        "contadores": dict(_contadores),
+        "campos": list(_campos),
+    }
+
+
+def combinar(medicion):
+    """Suma a esta corrida lo que exportó otro proceso (etapas, contadores y campos)"""
+    for nombre, registro in medicion["etapas"].items():
+        acumulado = _etapas.setdefault(nombre, {"llamadas": 0, "segundos": 0.0, "segundos_cpu": 0.0})
+        for clave in ("llamadas", "segundos", "segundos_cpu"):
+            acumulado[clave] += registro[clave]
+    for nombre, valor in medicion["contadores"].items():
+        _contadores[nombre] = _contadores.get(nombre, 0) + valor
+    _campos.extend(medicion["campos"])
+
+
+def iniciar_en_proceso(encender):
+    """
+    En un proceso hijo: deja la instrumentación como en el padre y sin lo
+    heredado, para que exportar() devuelva solo lo de la tarea actual.
+    """
+    activar(encender)
+    if encender:
+        reiniciar()
+
+
+def reporte():
+    """Reporte de la corrida como diccionario"""
+    totales = {"campos": len(_campos)}
+    for clave in ("estaciones", "sensores", "frecuencias", "grupos"):
+        totales[clave] = sum(registro.get(clave, 0) for registro in _campos)
+    return {
+        "segundos_totales": time.perf_counter() - _inicio if _inicio is not None else 0.0,
+        "totales": totales,
+        "etapas": {nombre: dict(registro) for nombre, registro in _etapas.items()},
+        "contadores": dict(_contadores),
+        "campos": list(_campos),
+    }
+
+
+def guardar_reporte(ruta):
+    with open(ruta, "w", encoding="utf-8") as archivo:
+        json.dump(reporte(), archivo, indent=2, ensure_ascii=False)
+
+
+def _guardar_al_salir(ruta):
+    if activa:
+        guardar_reporte(ruta)
+
+
+if os.environ.get("AGRO_INSTRUMENTACION", "").lower() in ("1", "si", "true"):
+    activar()
+    if os.environ.get("AGRO_INSTRUMENTACION_REPORTE"):
+        atexit.register(_guardar_al_salir, os.environ["AGRO_INSTRUMENTACION_REPORTE"])
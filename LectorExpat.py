@@ -0,0 +1,113 @@
+"""
+Lector del archivo de entrada sobre xml.parsers.expat, sin ElementTree.
+
+Los eventos de inicio y fin de etiqueta van llenando directamente las listas
+que necesita armar_campo (estaciones, ids de estación y textos de cada
+sensor); no se crea ningún Element. Lee lo mismo que el lector con
+ElementTree: solo los <campo> hijos de la raíz, la primera sección de cada
+tipo dentro del campo, sus hijos directos y, de cada <frecuencia>, el texto
+anterior a su primer hijo.
+"""
+from xml.etree.ElementTree import ParseError
+from xml.parsers import expat
+
+from CargarProcesarSalidaDatos import armar_campo
+
+TAMANO_BLOQUE = 1 << 16
+
+# Sección del campo -> etiqueta de sus hijos
+_SECCIONES = {"estacionesBase": "estacion", "sensoresSuelo": "sensorS", "sensoresCultivo": "sensorT"}
+
+
+def iterar_campos_expat(ruta_archivo, reporte=None, tamano_bloque=TAMANO_BLOQUE):
+    """Como iterar_campos_xml, con expat: entrega cada campo apenas se cierra su etiqueta"""
+    listos = []
+
+    # Estado del recorrido (profundidad 1 es la raíz, 2 un <campo>, ...)
+    profundidad = 0
+    campo = None           # [id, nombre, estaciones, sensores suelo, sensores cultivo]
+    secciones_vistas = None
+    seccion = None         # etiqueta de la sección abierta que se está leyendo
+    sensor = None          # (id, nombre, ids de estación, textos)
+    partes_texto = None    # trozos del texto de la <frecuencia> abierta
+
+    def cerrar_texto():
+        nonlocal partes_texto
+        # Como Element.text: None si la frecuencia no tiene texto
+        sensor[3][-1] = "".join(partes_texto) or None
+        partes_texto = None
+
+    def inicio(etiqueta, atributos):
+        nonlocal profundidad, campo, secciones_vistas, seccion, sensor, partes_texto
+        profundidad += 1
+        if partes_texto is not None:
+            # El texto de la frecuencia termina en su primer hijo
+            cerrar_texto()
+
+        if profundidad == 2:
+            if etiqueta == "campo":
+                campo = [atributos.get("id"), atributos.get("nombre"), [], [], []]
+                secciones_vistas = set()
+        elif campo is None:
+            return
+        elif profundidad == 3:
+            # Igual que campo.find(...): solo cuenta la primera sección de cada tipo
+            if etiqueta in _SECCIONES and etiqueta not in secciones_vistas:
+                secciones_vistas.add(etiqueta)
+                seccion = etiqueta
+        elif profundidad == 4 and seccion is not None:
+            if etiqueta != _SECCIONES[seccion]:
+                return
+            if seccion == "estacionesBase":
+                campo[2].append((atributos.get("id"), atributos.get("nombre")))
+            else:
+                sensor = (atributos.get("id"), atributos.get("nombre"), [], [])
+                campo[3 if seccion == "sensoresSuelo" else 4].append(sensor)
+        elif profundidad == 5 and sensor is not None and etiqueta == "frecuencia":
+            sensor[2].append(atributos.get("idEstacion"))
+            sensor[3].append(None)
+            partes_texto = []
+
+    def fin(etiqueta):
+        nonlocal profundidad, campo, seccion, sensor
+        if partes_texto is not None:
+            cerrar_texto()
+        if profundidad == 4:
+            sensor = None
+        elif profundidad == 3:
+            seccion = None
+        elif profundidad == 2 and campo is not None:
+            listos.append(campo)
+            campo = None
+        profundidad -= 1
+
+    def texto(datos):
+        if partes_texto is not None:
+            partes_texto.append(datos)
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = inicio
+    parser.EndElementHandler = fin
+    parser.CharacterDataHandler = texto
+
+    with open(ruta_archivo, "rb") as archivo:
+        while True:
+            bloque = archivo.read(tamano_bloque)
+            error = None
+            try:
+                parser.Parse(bloque, not bloque)
+            except expat.ExpatError as e:
+                # Mismo tipo de error que el lector con ElementTree
+                error = ParseError(f"{expat.ErrorString(e.code)}: line {e.lineno}, column {e.offset}")
+                error.code = e.code
+                error.position = (e.lineno, e.offset)
+
+            # Los campos cerrados antes del error se entregan, igual que con iterparse
+            for datos in listos:
+                yield armar_campo(*datos, reporte)
+            listos.clear()
+            if error is not None:
+                raise error
+            if not bloque:
+                break
@@ -0,0 +1,263 @@
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional, solo lo necesita el motor "matriz"
+    np = None
+
+try:
+    from scipy import sparse
+except ImportError:  # sin SciPy se usa siempre la matriz densa
+    sparse = None
+
+from EstructuraBase import ListaEnlazada, Patron
+from Entidades import GrupoEstaciones
+
+# Por debajo de esta densidad conviene una matriz dispersa (si SciPy está disponible)
+DENSIDAD_MAXIMA_DISPERSA = 0.05
+
+
+def numpy_disponible():
+    """Indica si el motor matricial puede usarse"""
+    return np is not None
+
+
+class MatrizFrecuencias:
+    """
+    Matriz estaciones x sensores con las frecuencias de un campo agrícola.
+
+    Las filas siguen el orden de las estaciones del campo (un id repetido
+    se queda con la primera fila) y las columnas el orden de los sensores.
+    """
+
+    def __init__(self, campo, dispersa=None):
+        if np is None:
+            raise ImportError("El motor matricial requiere NumPy (pip install numpy)")
+
+        self.campo = campo
+
+        # Mapas estables fila <-> estación
+        self.estaciones = []
+        self.indice_estaciones = {}
+        for estacion in campo.estaciones:
+            if estacion.id not in self.indice_estaciones:
+                self.indice_estaciones[estacion.id] = len(self.estaciones)
+                self.estaciones.append(estacion)
+
+        # Mapas estables columna <-> sensor
+        self.sensores_suelo = list(campo.sensores_suelo)
+        self.sensores_cultivo = list(campo.sensores_cultivo)
+        self.indice_sensores_suelo = self._indexar_sensores(self.sensores_suelo)
+        self.indice_sensores_cultivo = self._indexar_sensores(self.sensores_cultivo)
+
+        self.suelo = self._construir(self.sensores_suelo, dispersa)
+        # Ambas matrices con la misma representación: el resto de la clase lo supone
+        self.cultivo = self._construir(self.sensores_cultivo,
+                                       sparse is not None and sparse.issparse(self.suelo))
+
+        self.etiquetas = None
+        self.representantes = None
+        self.reducida_suelo = None
+        self.reducida_cultivo = None
+
+    @staticmethod
+    def _indexar_sensores(sensores):
+        indice = {}
+        for columna, sensor in enumerate(sensores):
+            if sensor.id not in indice:
+                indice[sensor.id] = columna
+        return indice
+
+    def _construir(self, sensores, dispersa):
+        """Materializa la matriz de un tipo de sensor"""
+        filas = []
+        columnas = []
+        valores = []
+        for columna, sensor in enumerate(sensores):
+            for id_estacion, valor in sensor.items_frecuencia():
+                fila = self.indice_estaciones.get(id_estacion)
+                if fila is not None:
+                    filas.append(fila)
+                    columnas.append(columna)
+                    valores.append(valor)
+
+        if any(not sensor.frecuencias.valores_32_bits() for sensor in sensores):
+            # Con valores de 64 bits (o más) las sumas por grupo en int64 podrían desbordar
+            limite = 2 ** 63 // max(len(self.estaciones), 1)
+            if any(abs(valor) >= limite for valor in valores):
+                raise ValueError("El motor matriz trabaja con enteros de 64 bits y hay frecuencias "
+                                 "demasiado grandes; use otro motor de agrupamiento")
+
+        forma = (len(self.estaciones), len(sensores))
+        if dispersa is None:
+            celdas = forma[0] * forma[1]
+            dispersa = (sparse is not None and celdas > 0 and
+                        len(valores) / celdas < DENSIDAD_MAXIMA_DISPERSA)
+        if dispersa and sparse is None:
+            raise ImportError("La matriz dispersa requiere SciPy (pip install scipy)")
+
+        if dispersa:
+            return sparse.csr_matrix((np.array(valores, dtype=np.int64),
+                                      (np.array(filas, dtype=np.int64),
+                                       np.array(columnas, dtype=np.int64))),
+                                     shape=forma)
+
+        matriz = np.zeros(forma, dtype=np.int64)
+        if valores:
+            matriz[np.array(filas), np.array(columnas)] = valores
+        return matriz
+
+    @property
+    def es_dispersa(self):
+        return sparse is not None and sparse.issparse(self.suelo)
+
+    def calcular_patrones(self):
+        """Devuelve las matrices booleanas de patrones (matriz > 0)"""
+        return self.suelo > 0, self.cultivo > 0
+
+    def _bits_filas(self, patron):
+        """Empaqueta cada fila de un patrón booleano en un entero de Python"""
+        if sparse is not None and sparse.issparse(patron):
+            patron = patron.tocsr()
+            patron.eliminate_zeros()
+            bits = []
+            for fila in range(patron.shape[0]):
+                columnas = patron.indices[patron.indptr[fila]:patron.indptr[fila + 1]]
+                valor = 0
+                for columna in columnas:
+                    valor |= 1 << int(columna)
+                bits.append(valor)
+            return bits
+
+        empaquetado = np.packbits(patron, axis=1, bitorder='little')
+        return [int.from_bytes(fila.tobytes(), 'little') for fila in empaquetado]
+
+    def asignar_patrones(self):
+        """Guarda en cada estación sus objetos Patron calculados desde la matriz"""
+        patron_suelo, patron_cultivo = self.calcular_patrones()
+        bits_suelo = self._bits_filas(patron_suelo)
+        bits_cultivo = self._bits_filas(patron_cultivo)
+        num_suelo = len(self.sensores_suelo)
+        num_cultivo = len(self.sensores_cultivo)
+
+        for estacion in self.campo.estaciones:
+            fila = self.indice_estaciones[estacion.id]
+            estacion.patron_suelo = Patron.desde_bits(bits_suelo[fila], num_suelo)
+            estacion.patron_cultivo = Patron.desde_bits(bits_cultivo[fila], num_cultivo)
+
+    def agrupar(self):
+        """
+        Asigna a cada fila la etiqueta de su grupo. Los grupos se numeran
+        por orden de primera aparición, igual que en la comparación directa.
+        """
+        patron_suelo, patron_cultivo = self.calcular_patrones()
+        num_filas = len(self.estaciones)
+
+        if self.es_dispersa:
+            # Clave por fila: columnas activas de suelo y de cultivo
+            claves = {}
+            etiquetas = np.empty(num_filas, dtype=np.int64)
+            representantes = []
+            patron_suelo = patron_suelo.tocsr()
+            patron_cultivo = patron_cultivo.tocsr()
+            patron_suelo.eliminate_zeros()
+            patron_cultivo.eliminate_zeros()
+            for fila in range(num_filas):
+                clave = (patron_suelo.indices[patron_suelo.indptr[fila]:patron_suelo.indptr[fila + 1]].tobytes(),
+                         patron_cultivo.indices[patron_cultivo.indptr[fila]:patron_cultivo.indptr[fila + 1]].tobytes())
+                etiqueta = claves.get(clave)
+                if etiqueta is None:
+                    etiqueta = len(representantes)
+                    claves[clave] = etiqueta
+                    representantes.append(fila)
+                etiquetas[fila] = etiqueta
+            self.etiquetas = etiquetas
+            self.representantes = np.array(representantes, dtype=np.int64)
+            return self.etiquetas
+
+        if num_filas == 0:
+            self.etiquetas = np.empty(0, dtype=np.int64)
+            self.representantes = np.empty(0, dtype=np.int64)
+            return self.etiquetas
+
+        filas_empaquetadas = np.hstack((
+            np.packbits(patron_suelo, axis=1, bitorder='little'),
+            np.packbits(patron_cultivo, axis=1, bitorder='little'),
+        ))
+        _, primeros, inversa = np.unique(filas_empaquetadas, axis=0,
+                                         return_index=True, return_inverse=True)
+        inversa = inversa.reshape(-1)
+
+        # np.unique ordena lexicográficamente; renumerar por primera aparición
+        orden = np.argsort(primeros)
+        rango = np.empty_like(orden)
+        rango[orden] = np.arange(len(orden))
+        self.etiquetas = rango[inversa]
+        self.representantes = primeros[orden]
+        return self.etiquetas
+
+    def calcular_reducidas(self):
+        """Suma agrupada de frecuencias: matriz grupos x sensores"""
+        if self.etiquetas is None:
+            self.agrupar()
+        self.reducida_suelo = self._sumar_por_grupo(self.suelo)
+        self.reducida_cultivo = self._sumar_por_grupo(self.cultivo)
+        return self.reducida_suelo, self.reducida_cultivo
+
+    def _sumar_por_grupo(self, matriz):
+        num_grupos = len(self.representantes)
+        if self.es_dispersa:
+            # Producto con la matriz indicadora grupos x estaciones
+            num_filas = len(self.estaciones)
+            indicadora = sparse.csr_matrix(
+                (np.ones(num_filas, dtype=np.int64),
+                 (self.etiquetas, np.arange(num_filas))),
+                shape=(num_grupos, num_filas))
+            return (indicadora @ matriz).tocsr()
+
+        if num_grupos == 0:
+            return np.zeros((0, matriz.shape[1]), dtype=matriz.dtype)
+        orden = np.argsort(self.etiquetas, kind='stable')
+        inicios = np.searchsorted(self.etiquetas[orden], np.arange(num_grupos))
+        return np.add.reduceat(matriz[orden], inicios, axis=0)
+
+    def construir_grupos(self):
+        """
+        Construye los GrupoEstaciones (fachada de objetos) a partir de las
+        etiquetas. Si ya se calcularon las reducidas, se copian a cada grupo.
+        """
+        if self.etiquetas is None:
+            self.agrupar()
+        miembros = [[] for _ in range(len(self.representantes))]
+        for fila, etiqueta in enumerate(self.etiquetas.tolist()):
+            miembros[etiqueta].append(self.estaciones[fila])
+        objetos = [GrupoEstaciones(estaciones_grupo) for estaciones_grupo in miembros]
+
+        if self.reducida_suelo is not None:
+            for grupo in objetos:
+                grupo.frecuencias_totales = {}
+            self._copiar_totales(objetos, self.reducida_suelo, self.sensores_suelo)
+            self._copiar_totales(objetos, self.reducida_cultivo, self.sensores_cultivo)
+
+        grupos = ListaEnlazada()
+        grupos.extender(objetos)
+        return grupos
+
+    def _copiar_totales(self, objetos, reducida, sensores):
+        if sparse is not None and sparse.issparse(reducida):
+            coordenadas = reducida.tocoo()
+            filas, columnas, valores = coordenadas.row, coordenadas.col, coordenadas.data
+        else:
+            filas, columnas = np.nonzero(reducida)
+            valores = reducida[filas, columnas]
+        for fila, columna, valor in zip(filas.tolist(), columnas.tolist(), valores.tolist()):
+            objetos[fila].frecuencias_totales[sensores[columna]] = valor
+
+
+def procesar_campo_matricial(campo, dispersa=None):
+    """Calcula patrones, grupos y frecuencias reducidas de un campo con NumPy"""
+    matriz = MatrizFrecuencias(campo, dispersa)
+    matriz.asignar_patrones()
+    matriz.agrupar()
+    matriz.calcular_reducidas()
+    campo.matriz_frecuencias = matriz
+    campo.grupos_estaciones = matriz.construir_grupos()
+    return campo.grupos_estaciones
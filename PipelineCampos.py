@@ -0,0 +1,173 @@
+"""
+Carga, procesamiento y escritura solapados en un pipeline de hilos.
+
+    lector (hilo) --cola--> procesador (hilo, opcionalmente con procesos) --cola--> escritor
+
+Cada etapa pasa los campos a la siguiente por una cola acotada: si una etapa
+se atrasa, la anterior se bloquea al llenar su cola (contrapresión), así que
+nunca hay más de unos pocos campos en memoria. Los campos salen en el mismo
+orden del archivo, de modo que la salida es idéntica a la secuencial.
+
+Con el GIL, los hilos solapan sobre todo la E/S de lectura y escritura con el
+cálculo; para repartir el cálculo entre núcleos se usa max_workers, que manda
+cada campo a un proceso del pool.
+"""
+import queue
+import threading
+from collections import deque
+
+from CargarProcesarSalidaDatos import iterar_campos_xml, procesar_campo, EscritorXMLSalida, PoolCampos
+from Bitacora import registrar
+
+TAMANO_COLA = 4
+
+# Marca de fin de datos en las colas
+_FIN = object()
+
+
+class _ErrorEtapa:
+    """Error de una etapa, viaja por la cola hasta el consumidor"""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def _poner(cola, elemento, detener):
+    """put bloqueante que se rinde si el pipeline se detuvo"""
+    while not detener.is_set():
+        try:
+            cola.put(elemento, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _sacar(cola, detener):
+    """get bloqueante que devuelve _FIN si el pipeline se detuvo"""
+    while not detener.is_set():
+        try:
+            return cola.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _FIN
+
+
+def _etapa_lectura(fuente, salida, detener):
+    try:
+        for campo in fuente:
+            if not _poner(salida, campo, detener):
+                return
+        _poner(salida, _FIN, detener)
+    except BaseException as e:
+        _poner(salida, _ErrorEtapa(e), detener)
+
+
+def _etapa_proceso(entrada, salida, detener, motor, opciones):
+    try:
+        while True:
+            campo = _sacar(entrada, detener)
+            if campo is _FIN:
+                break
+            if isinstance(campo, _ErrorEtapa):
+                _poner(salida, campo, detener)
+                return
+            procesar_campo(campo, motor, **opciones)
+            if not _poner(salida, campo, detener):
+                return
+        _poner(salida, _FIN, detener)
+    except BaseException as e:
+        _poner(salida, _ErrorEtapa(e), detener)
+
+
+def _etapa_proceso_pool(entrada, salida, detener, motor, opciones, max_workers, tamano_cola):
+    """Como _etapa_proceso, pero calcula cada campo en un proceso del pool"""
+    pendientes = deque()   # (campo, futuro) en el orden de entrada
+
+    def entregar_primero():
+        campo, futuro = pendientes.popleft()
+        PoolCampos.aplicar(campo, futuro)
+        return _poner(salida, campo, detener)
+
+    try:
+        with PoolCampos(motor, max_workers, **opciones) as pool:
+            try:
+                while True:
+                    campo = _sacar(entrada, detener)
+                    if campo is _FIN:
+                        break
+                    if isinstance(campo, _ErrorEtapa):
+                        _poner(salida, campo, detener)
+                        return
+                    pendientes.append((campo, pool.enviar(campo)))
+                    # Ventana acotada de campos en vuelo: también cuentan para la memoria
+                    if len(pendientes) >= tamano_cola and not entregar_primero():
+                        return
+                while pendientes:
+                    if not entregar_primero():
+                        return
+            finally:
+                for _, futuro in pendientes:
+                    futuro.cancel()
+        _poner(salida, _FIN, detener)
+    except BaseException as e:
+        _poner(salida, _ErrorEtapa(e), detener)
+
+
+def iterar_campos_pipeline(fuente, motor="hash", tamano_cola=TAMANO_COLA, max_workers=None,
+                           **opciones):
+    """
+    Recorre fuente (un iterable de campos, p. ej. iterar_campos_xml) en un hilo
+    y los procesa en otro; entrega los campos ya procesados en el orden de
+    entrada. El consumidor (el escritor) trabaja mientras las etapas previas
+    avanzan con los campos siguientes. Un error en cualquier etapa se vuelve
+    a lanzar aquí y detiene el pipeline.
+    """
+    if tamano_cola < 1:
+        raise ValueError(f"El tamaño de cola debe ser al menos 1: {tamano_cola}")
+
+    detener = threading.Event()
+    leidos = queue.Queue(maxsize=tamano_cola)
+    procesados = queue.Queue(maxsize=tamano_cola)
+
+    if max_workers:
+        argumentos_proceso = (leidos, procesados, detener, motor, opciones, max_workers, tamano_cola)
+        objetivo_proceso = _etapa_proceso_pool
+    else:
+        argumentos_proceso = (leidos, procesados, detener, motor, opciones)
+        objetivo_proceso = _etapa_proceso
+
+    hilos = (threading.Thread(target=_etapa_lectura, args=(fuente, leidos, detener),
+                              name="pipeline-lectura", daemon=True),
+             threading.Thread(target=objetivo_proceso, args=argumentos_proceso,
+                              name="pipeline-proceso", daemon=True))
+    for hilo in hilos:
+        hilo.start()
+
+    try:
+        while True:
+            campo = procesados.get()
+            if campo is _FIN:
+                break
+            if isinstance(campo, _ErrorEtapa):
+                raise campo.error
+            yield campo
+    finally:
+        # Fin normal, error o consumidor que abandona: las etapas se cierran solas
+        detener.set()
+        for hilo in hilos:
+            hilo.join()
+
+
+def procesar_xml_pipeline(ruta_entrada, ruta_salida, motor="hash", indentar=True,
+                          tamano_cola=TAMANO_COLA, max_workers=None, **opciones):
+    """Igual que procesar_xml_streaming, con lectura, proceso y escritura solapados"""
+    campos = iterar_campos_pipeline(iterar_campos_xml(ruta_entrada), motor, tamano_cola,
+                                    max_workers, **opciones)
+    with EscritorXMLSalida(ruta_salida, indentar) as escritor:
+        for campo in campos:
+            escritor.escribir_campo(campo)
+    registrar(f"➢ Archivo de salida generado en: {ruta_salida}")
+    return escritor.campos_escritos
@@ -1,20 +1,46 @@
-from CargarProcesarSalidaDatos import procesar_campo, generar_xml_salida
-from GraficaDatos import GraficadoraDatos
-
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
 import xml.etree.ElementTree as ET
+
+import Bitacora
+import Instrumentacion
+from Bitacora import registrar, registrar_error, DETALLE
+from CargarProcesarSalidaDatos import (procesar_campo, procesar_campos_paralelo, generar_xml_salida,
+                                       construir_campo_desde_xml, cargar_campos, iterar_campos_xml,
+                                       EscritorXMLSalida)
 from EstructuraBase import ListaEnlazada
-from Entidades import CampoAgricola, Estacion, SensorSuelo, SensorCultivo
 
 # Variables globales
 campos_cargados = ListaEnlazada()
-graficadora = GraficadoraDatos()
+graficadora = None
+
+TIPOS_GRAFICA = ("frecuencias", "patrones", "reducida")
+
 
+def _obtener_graficadora(formato="png", modo_grande="raster"):
+    """Importa graphviz solo cuando realmente se pide una gráfica"""
+    global graficadora
+    if graficadora is None:
+        from GraficaDatos import GraficadoraDatos
+        graficadora = GraficadoraDatos(formato, modo_grande=modo_grande)
+    return graficadora
 
-def cargar_xml(ruta_archivo):
-    """Función para cargar archivo XML"""
+
+def cargar_xml(ruta_archivo, lector="etree"):
+    """Función para cargar archivo XML (lector: "etree" o "expat")"""
     global campos_cargados
     try:
-        print(f"➢ Cargando archivo: {ruta_archivo}")
+        registrar(f"➢ Cargando archivo: {ruta_archivo}")
+
+        if lector != "etree":
+            campos_cargados = cargar_campos(ruta_archivo, lector=lector)
+            registrar("✅ Archivo cargado exitosamente")
+            return campos_cargados
 
         # Parsear el XML
         tree = ET.parse(ruta_archivo)
@@ -25,62 +51,16 @@ def cargar_xml(ruta_archivo):
 
         # Procesar cada campo agrícola
         for campo_elem in root.findall('campo'):
-            campo_id = campo_elem.get('id')
-            campo_nombre = campo_elem.get('nombre')
-            campo = CampoAgricola(campo_id, campo_nombre)
-
-            print(f"➢ Cargando campo agrícola {campo_id}")
-
-            # Procesar estaciones base
-            estaciones_base = campo_elem.find('estacionesBase')
-            if estaciones_base is not None:
-                for estacion_elem in estaciones_base.findall('estacion'):
-                    estacion_id = estacion_elem.get('id')
-                    estacion_nombre = estacion_elem.get('nombre')
-                    estacion = Estacion(estacion_id, estacion_nombre)
-                    campo.agregar_estacion(estacion)
-                    print(f"➢ Creando estación base {estacion_id}")
-
-            # Procesar sensores de suelo
-            sensores_suelo = campo_elem.find('sensoresSuelo')
-            if sensores_suelo is not None:
-                for sensor_elem in sensores_suelo.findall('sensorS'):
-                    sensor_id = sensor_elem.get('id')
-                    sensor_nombre = sensor_elem.get('nombre')
-                    sensor = SensorSuelo(sensor_id, sensor_nombre)
-
-                    # Procesar frecuencias
-                    for freq_elem in sensor_elem.findall('frecuencia'):
-                        id_estacion = freq_elem.get('idEstacion')
-                        valor = int(freq_elem.text.strip())
-                        sensor.agregar_frecuencia(id_estacion, valor)
-
-                    campo.agregar_sensor_suelo(sensor)
-
-            # Procesar sensores de cultivo
-            sensores_cultivo = campo_elem.find('sensoresCultivo')
-            if sensores_cultivo is not None:
-                for sensor_elem in sensores_cultivo.findall('sensorT'):
-                    sensor_id = sensor_elem.get('id')
-                    sensor_nombre = sensor_elem.get('nombre')
-                    sensor = SensorCultivo(sensor_id, sensor_nombre)
-
-                    # Procesar frecuencias
-                    for freq_elem in sensor_elem.findall('frecuencia'):
-                        id_estacion = freq_elem.get('idEstacion')
-                        valor = int(freq_elem.text.strip())
-                        sensor.agregar_frecuencia(id_estacion, valor)
-
-                    campo.agregar_sensor_cultivo(sensor)
+            campo = construir_campo_desde_xml(campo_elem)
 
             # Agregar campo a la lista
             campos_cargados.insertar(campo)
 
-        print("✅ Archivo cargado exitosamente")
+        registrar("✅ Archivo cargado exitosamente")
         return campos_cargados
 
     except Exception as e:
-        print(f"❌ Error al cargar archivo: {e}")
+        registrar_error(f"❌ Error al cargar archivo: {e}")
         return None
 
 
@@ -89,32 +69,41 @@ def _lista_esta_vacia(lista_enlazada):
     return lista_enlazada.cabeza is None
 
 
-def procesar_archivo():
-    """Función para procesar el archivo cargado"""
+def procesar_archivo(paralelo=False, max_workers=None):
+    """
+    Función para procesar el archivo cargado.
+    Con paralelo=True los campos se reparten en un pool de procesos.
+    """
     global campos_cargados
     if _lista_esta_vacia(campos_cargados):
         print("❌ Error: Primero debe cargar un archivo (Opción 1)")
         return
 
-    print("➢ Procesando archivo...")
+    registrar("➢ Procesando archivo...")
+
+    if paralelo:
+        procesar_campos_paralelo(campos_cargados, max_workers=max_workers)
+        registrar("✅ Archivo procesado exitosamente")
+        return
 
     actual_campo = campos_cargados.cabeza
     while actual_campo is not None:
         campo = actual_campo.dato
-        print(f"➢ Procesando campo {campo.id}: {campo.nombre}")
+        registrar(f"➢ Procesando campo {campo.id}: {campo.nombre}")
 
-        # Procesar cada estación
-        actual_estacion = campo.estaciones.cabeza
-        while actual_estacion is not None:
-            estacion = actual_estacion.dato
-            print(f"➢ Procesando estación base {estacion.id}")
-            actual_estacion = actual_estacion.siguiente
+        # Listar cada estación solo si se pidió el detalle
+        if Bitacora.detalle_activo():
+            actual_estacion = campo.estaciones.cabeza
+            while actual_estacion is not None:
+                estacion = actual_estacion.dato
+                registrar(f"➢ Procesando estación base {estacion.id}", DETALLE)
+                actual_estacion = actual_estacion.siguiente
 
         # Procesar el campo
         procesar_campo(campo)
         actual_campo = actual_campo.siguiente
 
-    print("✅ Archivo procesado exitosamente")
+    registrar("✅ Archivo procesado exitosamente")
 
 
 def escribir_archivo_salida():
@@ -154,7 +143,7 @@ def mostrar_datos_estudiante():
 
 def generar_grafica():
     """Función para generar gráficas"""
-    global campos_cargados, graficadora
+    global campos_cargados
 
     if _lista_esta_vacia(campos_cargados):
         print("❌ Error: Primero debe cargar un archivo (Opción 1)")
@@ -204,7 +193,7 @@ def generar_grafica():
             nombre_archivo = f"grafica_{campo_seleccionado.id}_{tipo_grafica}"
 
         # Generar la gráfica
-        success = graficadora.generar_grafica(campo_seleccionado, tipo_grafica, nombre_archivo)
+        success = _obtener_graficadora().generar_grafica(campo_seleccionado, tipo_grafica, nombre_archivo)
         if success:
             print("Gráfica generada exitosamente")
             print(f"➢ La gráfica se ha guardado como: {nombre_archivo}.png")
@@ -260,5 +249,393 @@ def menu():
             print(" Opción no válida. Intente nuevamente.")
 
 
+def _nombre_base(ruta_entrada):
+    return os.path.splitext(os.path.basename(ruta_entrada))[0]
+
+
+def _procesar_en_orden(campos, motor, opciones_motor):
+    for campo in campos:
+        procesar_campo(campo, motor, **opciones_motor)
+        yield campo
+
+
+def procesar_archivo_lote(ruta_entrada, directorio_salida, graficas=(), motor="hash",
+                          paralelo=False, max_workers=None, directorio_cache=None, validacion=None,
+                          opciones_motor=None, pipeline=False, tamano_cola=None, resumen=None,
+                          lector="etree"):
+    """
+    Carga, procesa y escribe un archivo sin interacción.
+    Sin modo paralelo se trabaja campo por campo con memoria acotada.
+    Con directorio_cache los campos se leen del snapshot binario si existe.
+    Con validacion ("rapido" o "completo") los datos se validan al cargar; si
+    hay problemas se escribe <nombre>_validacion.json y el archivo falla.
+    opciones_motor se pasa al motor de agrupamiento (p. ej. distancia_maxima).
+    Con pipeline, lectura, proceso y escritura corren solapados en hilos con
+    colas de tamano_cola campos (con paralelo, el proceso usa el pool).
+    Si se pasa el diccionario resumen, se le suman campos, estaciones y grupos.
+    lector elige el parser del XML: "etree" (ElementTree) o "expat".
+    """
+    opciones_motor = opciones_motor or {}
+    nombre = _nombre_base(ruta_entrada)
+    ruta_salida = os.path.join(directorio_salida, f"{nombre}_salida.xml")
+    registrar(f"➢ Cargando archivo: {ruta_entrada}")
+
+    if validacion is not None:
+        campos = _cargar_validando(ruta_entrada, directorio_salida, nombre, validacion, lector)
+    elif directorio_cache is not None:
+        from CacheCampos import cargar_con_cache
+        campos = cargar_con_cache(ruta_entrada, directorio_cache, lector)
+    elif paralelo and not pipeline:
+        campos = cargar_campos(ruta_entrada, lector=lector)
+    else:
+        campos = iterar_campos_xml(ruta_entrada, lector=lector)
+
+    if pipeline:
+        from PipelineCampos import iterar_campos_pipeline, TAMANO_COLA
+        campos = iterar_campos_pipeline(campos, motor, tamano_cola or TAMANO_COLA,
+                                        (max_workers or os.cpu_count()) if paralelo else None,
+                                        **opciones_motor)
+    elif paralelo:
+        procesar_campos_paralelo(campos, motor, max_workers, **opciones_motor)
+    else:
+        campos = _procesar_en_orden(campos, motor, opciones_motor)
+
+    # Se escribe en un temporal y se renombra al terminar: si el archivo falla
+    # (aunque sea a mitad de la lectura) no queda una salida que parezca completa
+    temporal = ruta_salida + ".tmp"
+    try:
+        with _lote_graficas(graficas) as lote:
+            with EscritorXMLSalida(temporal) as escritor:
+                for campo in campos:
+                    escritor.escribir_campo(campo)
+                    if lote is not None:
+                        # Los renders de este campo siguen en el pool mientras se escribe el próximo
+                        lote.agregar([campo], graficas, directorio_salida,
+                                     f"{nombre}_campo{{campo}}_{{tipo}}")
+                    if resumen is not None:
+                        resumen["campos"] += 1
+                        resumen["estaciones"] += len(campo.estaciones)
+                        resumen["grupos"] += len(campo.grupos_estaciones)
+            if lote is not None:
+                for ruta_grafica, exito in lote.esperar():
+                    if not exito:
+                        raise RuntimeError(f"No se pudo generar la gráfica {ruta_grafica}")
+        os.replace(temporal, ruta_salida)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    registrar(f"➢ Archivo de salida generado en: {ruta_salida}")
+    return ruta_salida
+
+
+def _reiniciar_pico_memoria():
+    """En Linux, vuelve a medir el pico de memoria (VmHWM) desde ahora"""
+    try:
+        with open("/proc/self/clear_refs", "w") as archivo:
+            archivo.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _pico_memoria_kb():
+    """Pico de memoria residente del proceso en KiB"""
+    try:
+        with open("/proc/self/status") as archivo:
+            for linea in archivo:
+                if linea.startswith("VmHWM:"):
+                    return int(linea.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+        # ru_maxrss está en KiB en Linux (y no se puede reiniciar)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return None
+
+
+def procesar_archivo_resumido(ruta_entrada, directorio_salida, **opciones_lote):
+    """
+    Procesa un archivo con procesar_archivo_lote y devuelve su resumen:
+    estaciones y grupos, segundos y pico de memoria. Un error no se propaga,
+    queda anotado en el resumen.
+    """
+    resumen = {"archivo": ruta_entrada, "exito": False, "campos": 0, "estaciones": 0, "grupos": 0}
+    _reiniciar_pico_memoria()
+    inicio = time.perf_counter()
+    try:
+        with Instrumentacion.medir("procesar_archivo"):
+            resumen["salida"] = procesar_archivo_lote(ruta_entrada, directorio_salida,
+                                                      resumen=resumen, **opciones_lote)
+        resumen["exito"] = True
+    except Exception as e:
+        resumen["error"] = str(e)
+        # Lo contado antes del error no llegó a ninguna salida
+        resumen.update(campos=0, estaciones=0, grupos=0)
+    resumen["segundos"] = time.perf_counter() - inicio
+    resumen["memoria_pico_kb"] = _pico_memoria_kb()
+    return resumen
+
+
+def _procesar_archivo_en_proceso(ruta_entrada, directorio_salida, instrumentar, opciones_lote):
+    """Tarea de cada proceso del pool: el resumen del archivo y, con instrumentar, lo medido"""
+    Instrumentacion.iniciar_en_proceso(instrumentar)
+    resumen = procesar_archivo_resumido(ruta_entrada, directorio_salida, **opciones_lote)
+    return resumen, Instrumentacion.exportar() if instrumentar else None
+
+
+def _recibir_resumen(resultado):
+    """Desempaqueta el resultado de un hijo y suma su medición al reporte del padre"""
+    resumen, medicion = resultado
+    if medicion is not None:
+        Instrumentacion.combinar(medicion)
+    return resumen
+
+
+def _resumen_fallido(ruta_entrada, error):
+    return {"archivo": ruta_entrada, "exito": False, "campos": 0, "estaciones": 0, "grupos": 0,
+            "error": error, "segundos": 0.0, "memoria_pico_kb": None}
+
+
+def procesar_lote_archivos(rutas, directorio_salida, procesos=None, **opciones_lote):
+    """
+    Procesa varios archivos y devuelve sus resúmenes en el orden de rutas.
+    Con procesos > 1 cada archivo completo va a un proceso del pool; el fallo
+    de un archivo (incluso la caída de su proceso) no detiene a los demás.
+    """
+    if not procesos or procesos < 2 or len(rutas) < 2:
+        resumenes = []
+        for ruta in rutas:
+            resumen = procesar_archivo_resumido(ruta, directorio_salida, **opciones_lote)
+            if not resumen["exito"]:
+                registrar_error(f"❌ Error al procesar {ruta}: {resumen['error']}")
+            resumenes.append(resumen)
+        return resumenes
+
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    resumenes = [None] * len(rutas)
+    caidos = []
+    with Instrumentacion.medir("procesar_lote_archivos"), \
+            ProcessPoolExecutor(max_workers=min(procesos, len(rutas))) as executor:
+        futuros = [executor.submit(_procesar_archivo_en_proceso, ruta, directorio_salida,
+                                   Instrumentacion.activa, opciones_lote)
+                   for ruta in rutas]
+        for posicion, (ruta, futuro) in enumerate(zip(rutas, futuros)):
+            try:
+                resumenes[posicion] = _recibir_resumen(futuro.result())
+            except BrokenProcessPool:
+                caidos.append(posicion)
+                continue
+            except Exception as e:
+                resumenes[posicion] = _resumen_fallido(ruta, str(e))
+            if not resumenes[posicion]["exito"]:
+                registrar_error(f"❌ Error al procesar {ruta}: {resumenes[posicion]['error']}")
+
+    # Un proceso que se cae rompe el pool entero: esos archivos se reintentan
+    # de a uno, cada uno en su propio proceso, para aislar al culpable
+    for posicion in caidos:
+        ruta = rutas[posicion]
+        try:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                resumenes[posicion] = _recibir_resumen(executor.submit(
+                    _procesar_archivo_en_proceso, ruta, directorio_salida,
+                    Instrumentacion.activa, opciones_lote).result())
+        except BrokenProcessPool:
+            resumenes[posicion] = _resumen_fallido(ruta, "el proceso terminó de forma inesperada")
+        except Exception as e:
+            resumenes[posicion] = _resumen_fallido(ruta, str(e))
+        if not resumenes[posicion]["exito"]:
+            registrar_error(f"❌ Error al procesar {ruta}: {resumenes[posicion]['error']}")
+    return resumenes
+
+
+def _totales_lote(resumenes):
+    totales = {"archivos": len(resumenes),
+               "fallidos": sum(1 for resumen in resumenes if not resumen["exito"])}
+    for clave in ("campos", "estaciones", "grupos", "segundos"):
+        totales[clave] = sum(resumen[clave] for resumen in resumenes)
+    picos = [resumen["memoria_pico_kb"] for resumen in resumenes if resumen["memoria_pico_kb"] is not None]
+    totales["memoria_pico_kb"] = max(picos) if picos else None
+    return totales
+
+
+def _mostrar_resumen_lote(resumenes, totales):
+    registrar("➢ Resumen del lote:")
+    for resumen in resumenes:
+        memoria = (f"{resumen['memoria_pico_kb'] / 1024:.1f} MB"
+                   if resumen["memoria_pico_kb"] is not None else "-")
+        estado = "✅" if resumen["exito"] else "❌"
+        registrar(f"   {estado} {resumen['archivo']}: {resumen['estaciones']} estaciones -> "
+                  f"{resumen['grupos']} grupos, {resumen['segundos']:.2f} s, pico {memoria}")
+    registrar(f"➢ Total: {totales['estaciones']} estaciones -> {totales['grupos']} grupos "
+              f"en {totales['campos']} campos")
+
+
+def _cargar_validando(ruta_entrada, directorio_salida, nombre, modo, lector="etree"):
+    from ValidacionDatos import ReporteValidacion, ErrorValidacion
+
+    reporte = ReporteValidacion(modo)
+    try:
+        campos = cargar_campos(ruta_entrada, reporte, lector)
+    except ErrorValidacion:
+        pass
+    if reporte.es_valido():
+        return campos
+
+    ruta_reporte = os.path.join(directorio_salida, f"{nombre}_validacion.json")
+    reporte.guardar_json(ruta_reporte)
+    registrar_error(f"❌ Reporte de validación generado en: {ruta_reporte}")
+    raise ErrorValidacion(reporte)
+
+
+def _lote_graficas(graficas):
+    """Un solo pool de renders por archivo, compartido por todos sus campos"""
+    if not graficas:
+        return contextlib.nullcontext()
+    from GraficaDatos import LoteGraficas
+    return LoteGraficas(_obtener_graficadora())
+
+
+def _expandir_entradas(entradas):
+    """Acepta archivos, directorios (todos sus .xml) y patrones glob"""
+    rutas = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            rutas.extend(sorted(glob.glob(os.path.join(entrada, "*.xml"))))
+        elif glob.has_magic(entrada):
+            rutas.extend(sorted(glob.glob(entrada)))
+        else:
+            rutas.append(entrada)
+    return rutas
+
+
+def main(argumentos=None):
+    """
+    Punto de entrada. Sin argumentos abre el menú interactivo; con archivos
+    los procesa en lote y devuelve un código de salida distinto de cero si
+    alguno falla.
+    """
+    if argumentos is None:
+        argumentos = sys.argv[1:]
+    if not argumentos:
+        menu()
+        return 0
+
+    parser = argparse.ArgumentParser(
+        description="Procesa archivos de campos agrícolas sin el menú interactivo")
+    parser.add_argument("entradas", nargs="+", help="archivos XML, directorios o patrones glob")
+    parser.add_argument("-o", "--directorio-salida", default=".",
+                        help="directorio donde se escriben las salidas (por defecto, el actual)")
+    parser.add_argument("-g", "--graficas", default="",
+                        help="tipos de gráfica separados por coma: frecuencias,patrones,reducida")
+    parser.add_argument("--formato-grafica", default="png", choices=("png", "svg"))
+    parser.add_argument("--modo-grafica-grande", default="raster", choices=("mosaico", "raster"),
+                        help="cómo dibujar matrices muy grandes en PNG: mapa de calor (por defecto) "
+                             "o tablas partidas en un archivo por parte")
+    parser.add_argument("--motor", default="hash", choices=("hash", "directa", "matriz", "tolerancia"),
+                        help="motor de agrupamiento")
+    parser.add_argument("--distancia-maxima", type=int, metavar="N", default=1,
+                        help="con --motor tolerancia, bits en que pueden diferir dos estaciones del mismo grupo")
+    parser.add_argument("--paralelo", type=int, metavar="N", default=0,
+                        help="procesar los campos de cada archivo con N procesos")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="solapar lectura, proceso y escritura en hilos con colas acotadas")
+    parser.add_argument("--tamano-cola", type=int, metavar="N", default=4,
+                        help="con --pipeline, campos que caben en cada cola entre etapas")
+    parser.add_argument("--procesos-archivos", type=int, metavar="N", default=0,
+                        help="repartir los archivos completos entre N procesos")
+    parser.add_argument("--resumen", metavar="RUTA",
+                        help="guardar en RUTA el resumen JSON del lote (por archivo y total)")
+    parser.add_argument("--validar", choices=("rapido", "completo"),
+                        help="validar los datos al cargar: cortar en el primer problema o juntarlos todos")
+    parser.add_argument("--lector", default="etree", choices=("etree", "expat"),
+                        help="parser del XML de entrada: ElementTree o expat (más rápido y liviano)")
+    parser.add_argument("--cache", metavar="DIR",
+                        help="guardar/reusar un snapshot binario de cada archivo en DIR")
+    parser.add_argument("--instrumentar", metavar="RUTA",
+                        help="medir tiempos por etapa y contadores y guardar el reporte JSON en RUTA")
+    parser.add_argument("-q", "--quiet", action="store_true", help="mostrar solo errores")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="mostrar también el detalle por estación")
+    opciones = parser.parse_args(argumentos)
+
+    if opciones.quiet:
+        Bitacora.establecer_nivel(Bitacora.SILENCIO)
+    elif opciones.verbose:
+        Bitacora.establecer_nivel(Bitacora.DETALLE)
+    else:
+        Bitacora.establecer_nivel(Bitacora.NORMAL)
+
+    graficas = [tipo.strip() for tipo in opciones.graficas.split(",") if tipo.strip()]
+    for tipo in graficas:
+        if tipo not in TIPOS_GRAFICA:
+            parser.error(f"tipo de gráfica no válido: {tipo}")
+
+    if graficas:
+        try:
+            _obtener_graficadora(opciones.formato_grafica, opciones.modo_grafica_grande)
+        except ImportError as e:
+            registrar_error(f"❌ Error: las gráficas requieren graphviz ({e})")
+            return 1
+
+    rutas = _expandir_entradas(opciones.entradas)
+    if not rutas:
+        registrar_error("❌ Error: no se encontraron archivos de entrada")
+        return 2
+
+    opciones_motor = {}
+    if opciones.motor == "tolerancia":
+        if opciones.distancia_maxima < 0:
+            parser.error("la distancia máxima no puede ser negativa")
+        opciones_motor["distancia_maxima"] = opciones.distancia_maxima
+
+    if opciones.instrumentar:
+        Instrumentacion.activar()
+        Instrumentacion.reiniciar()
+
+    if opciones.tamano_cola < 1:
+        parser.error("el tamaño de cola debe ser al menos 1")
+    if opciones.procesos_archivos < 0:
+        parser.error("la cantidad de procesos no puede ser negativa")
+    if opciones.procesos_archivos > 1 and opciones.paralelo > 0:
+        parser.error("--procesos-archivos y --paralelo no se pueden combinar")
+
+    os.makedirs(opciones.directorio_salida, exist_ok=True)
+    resumenes = procesar_lote_archivos(rutas, opciones.directorio_salida,
+                                       procesos=opciones.procesos_archivos,
+                                       graficas=graficas, motor=opciones.motor,
+                                       paralelo=opciones.paralelo > 0,
+                                       max_workers=opciones.paralelo or None,
+                                       directorio_cache=opciones.cache,
+                                       validacion=opciones.validar,
+                                       opciones_motor=opciones_motor,
+                                       pipeline=opciones.pipeline,
+                                       tamano_cola=opciones.tamano_cola,
+                                       lector=opciones.lector)
+    totales = _totales_lote(resumenes)
+    fallidos = totales["fallidos"]
+    if len(rutas) > 1:
+        _mostrar_resumen_lote(resumenes, totales)
+    if opciones.resumen:
+        with open(opciones.resumen, "w", encoding="utf-8") as archivo:
+            json.dump({"archivos": resumenes, "totales": totales}, archivo, indent=2, ensure_ascii=False)
+        registrar(f"➢ Resumen del lote generado en: {opciones.resumen}")
+
+    if opciones.instrumentar:
+        Instrumentacion.guardar_reporte(opciones.instrumentar)
+        registrar(f"➢ Reporte de instrumentación generado en: {opciones.instrumentar}")
+
+    if fallidos:
+        registrar_error(f"❌ {fallidos} de {len(rutas)} archivos fallaron")
+        return 1
+    registrar(f"✅ {len(rutas)} archivos procesados exitosamente")
+    return 0
+
+
 if __name__ == "__main__":
-    menu()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
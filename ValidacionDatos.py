@@ -0,0 +1,204 @@
+"""
+Validación de los datos de entrada durante la carga.
+
+Revisa en una sola pasada, con índices por hash, que:
+  - los ids de estaciones y sensores existan y no estén repetidos,
+  - cada <frecuencia idEstacion=...> apunte a una estación definida,
+  - un sensor no tenga dos frecuencias para la misma estación,
+  - los valores sean enteros no negativos.
+
+Modo "completo": junta todos los problemas en el reporte.
+Modo "rapido": lanza ErrorValidacion con el primer problema encontrado.
+"""
+import json
+
+from EstructuraBase import ListaEnlazada
+
+MODO_COMPLETO = "completo"
+MODO_RAPIDO = "rapido"
+MODOS_VALIDACION = (MODO_COMPLETO, MODO_RAPIDO)
+
+# Tipos de problema
+ID_FALTANTE = "id_faltante"
+ESTACION_REPETIDA = "estacion_repetida"
+SENSOR_REPETIDO = "sensor_repetido"
+REFERENCIA_INEXISTENTE = "referencia_inexistente"
+FRECUENCIA_REPETIDA = "frecuencia_repetida"
+VALOR_NO_ENTERO = "valor_no_entero"
+VALOR_NEGATIVO = "valor_negativo"
+
+
+class ProblemaDato:
+    """Un problema encontrado en los datos, con su ubicación"""
+
+    __slots__ = ("tipo", "campo", "sensor", "estacion", "valor", "detalle")
+
+    def __init__(self, tipo, campo, detalle, sensor=None, estacion=None, valor=None):
+        self.tipo = tipo
+        self.campo = campo
+        self.sensor = sensor
+        self.estacion = estacion
+        self.valor = valor
+        self.detalle = detalle
+
+    def como_diccionario(self):
+        datos = {"tipo": self.tipo, "campo": self.campo, "detalle": self.detalle}
+        for clave in ("sensor", "estacion", "valor"):
+            valor = getattr(self, clave)
+            if valor is not None:
+                datos[clave] = valor
+        return datos
+
+    def __str__(self):
+        return f"Campo {self.campo}: {self.detalle}"
+
+
+class ErrorValidacion(ValueError):
+    """Datos inválidos; trae el reporte con los problemas encontrados"""
+
+    def __init__(self, reporte):
+        self.reporte = reporte
+        primero = reporte.problemas.cabeza.dato if not reporte.problemas.esta_vacia() else None
+        if reporte.modo == MODO_RAPIDO or len(reporte.problemas) == 1:
+            mensaje = f"Datos inválidos: {primero}"
+        else:
+            mensaje = f"Datos inválidos: {len(reporte.problemas)} problemas (el primero: {primero})"
+        super().__init__(mensaje)
+
+
+class ReporteValidacion:
+    """Problemas encontrados al validar uno o más campos"""
+
+    def __init__(self, modo=MODO_COMPLETO):
+        if modo not in MODOS_VALIDACION:
+            raise ValueError(f"Modo de validación no válido: {modo}")
+        self.modo = modo
+        self.problemas = ListaEnlazada()
+        self.campos_revisados = 0
+        self.frecuencias_revisadas = 0
+
+    def agregar(self, tipo, campo, detalle, **ubicacion):
+        """Registra un problema; en modo rápido corta la carga en el acto"""
+        self.problemas.insertar(ProblemaDato(tipo, campo, detalle, **ubicacion))
+        if self.modo == MODO_RAPIDO:
+            raise ErrorValidacion(self)
+
+    def es_valido(self):
+        return self.problemas.esta_vacia()
+
+    def verificar(self):
+        """Lanza ErrorValidacion si se encontró algún problema"""
+        if not self.es_valido():
+            raise ErrorValidacion(self)
+
+    def resumen(self):
+        """Cantidad de problemas por tipo"""
+        cantidades = {}
+        for problema in self.problemas:
+            cantidades[problema.tipo] = cantidades.get(problema.tipo, 0) + 1
+        return cantidades
+
+    def como_diccionario(self):
+        return {
+            "valido": self.es_valido(),
+            "modo": self.modo,
+            "campos_revisados": self.campos_revisados,
+            "frecuencias_revisadas": self.frecuencias_revisadas,
+            "total_problemas": len(self.problemas),
+            "por_tipo": self.resumen(),
+            "problemas": [problema.como_diccionario() for problema in self.problemas],
+        }
+
+    def guardar_json(self, ruta):
+        with open(ruta, "w", encoding="utf-8") as archivo:
+            json.dump(self.como_diccionario(), archivo, indent=2, ensure_ascii=False)
+
+
+def leer_valor_frecuencia(texto, reporte, campo_id, sensor_id, id_estacion):
+    """Convierte el texto de una <frecuencia>; None (y un problema en el reporte) si no es entero"""
+    try:
+        return int(texto.strip())
+    except (AttributeError, ValueError):
+        reporte.agregar(VALOR_NO_ENTERO, campo_id,
+                        f"la frecuencia del sensor {sensor_id} para la estación {id_estacion} "
+                        f"no es un entero: {texto!r}",
+                        sensor=sensor_id, estacion=id_estacion, valor=texto)
+        return None
+
+
+def validar_campo(campo, reporte):
+    """
+    Revisa un campo ya construido. Cada chequeo es O(1) por elemento:
+    estaciones y sensores contra los mapas por id del campo, y las columnas
+    de cada sensor con operaciones de conjunto; solo si algo falla se
+    recorren para ubicar el problema.
+    """
+    reporte.campos_revisados += 1
+    campo_id = campo.id
+
+    # Índices (en la tabla de ids del campo) que corresponden a estaciones definidas
+    definidas = set()
+    buscar = campo.tabla_ids.buscar
+    for estacion in campo.estaciones:
+        if estacion.id is None:
+            reporte.agregar(ID_FALTANTE, campo_id, f"estación sin id ({estacion.nombre})")
+            continue
+        if campo.obtener_estacion_por_id(estacion.id) is not estacion:
+            reporte.agregar(ESTACION_REPETIDA, campo_id,
+                            f"la estación {estacion.id} está definida más de una vez",
+                            estacion=estacion.id)
+        definidas.add(buscar(estacion.id))
+
+    for tipo, sensores, obtener in (("suelo", campo.sensores_suelo, campo.obtener_sensor_suelo_por_id),
+                                    ("cultivo", campo.sensores_cultivo, campo.obtener_sensor_cultivo_por_id)):
+        for sensor in sensores:
+            if sensor.id is None:
+                reporte.agregar(ID_FALTANTE, campo_id, f"sensor de {tipo} sin id ({sensor.nombre})")
+            elif obtener(sensor.id) is not sensor:
+                reporte.agregar(SENSOR_REPETIDO, campo_id,
+                                f"el sensor de {tipo} {sensor.id} está definido más de una vez",
+                                sensor=sensor.id)
+            _validar_frecuencias(campo, sensor, definidas, reporte)
+
+
+def _validar_frecuencias(campo, sensor, definidas, reporte):
+    columnas = sensor.frecuencias
+    estaciones = columnas.estaciones
+    valores = columnas.valores
+    reporte.frecuencias_revisadas += len(estaciones)
+    if not estaciones:
+        return
+
+    if columnas.tabla_ids is not campo.tabla_ids:
+        # Sensor armado fuera del campo: se traducen sus índices a los del campo
+        estaciones = [campo.indice_estacion(id_estacion) for id_estacion in
+                      (columnas.tabla_ids[indice] for indice in estaciones)]
+
+    distintas = set(estaciones)
+    referencias_malas = distintas - definidas
+    hay_repetidas = len(distintas) != len(estaciones)
+    hay_negativos = min(valores) < 0
+    if not (referencias_malas or hay_repetidas or hay_negativos):
+        return
+
+    ids = columnas.tabla_ids.ids
+    vistas = set()
+    for posicion, indice in enumerate(columnas.estaciones):
+        id_estacion = ids[indice]
+        valor = valores[posicion]
+        if estaciones[posicion] in referencias_malas:
+            reporte.agregar(REFERENCIA_INEXISTENTE, campo.id,
+                            f"el sensor {sensor.id} tiene una frecuencia para la estación "
+                            f"{id_estacion}, que no está definida",
+                            sensor=sensor.id, estacion=id_estacion, valor=valor)
+        if indice in vistas:
+            reporte.agregar(FRECUENCIA_REPETIDA, campo.id,
+                            f"el sensor {sensor.id} tiene más de una frecuencia para la "
+                            f"estación {id_estacion} (se usa la primera)",
+                            sensor=sensor.id, estacion=id_estacion, valor=valor)
+        vistas.add(indice)
+        if valor < 0:
+            reporte.agregar(VALOR_NEGATIVO, campo.id,
+                            f"el sensor {sensor.id} tiene una frecuencia negativa ({valor}) "
+                            f"para la estación {id_estacion}",
+                            sensor=sensor.id, estacion=id_estacion, valor=valor)
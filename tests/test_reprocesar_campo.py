@@ -0,0 +1,84 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Bitacora
+from CargarProcesarSalidaDatos import calcular_campo, reprocesar_campo
+from Entidades import CampoAgricola, Estacion, SensorSuelo, SensorCultivo
+
+
+def crear_campo():
+    campo = CampoAgricola("1", "Campo de prueba")
+    for numero in range(1, 5):
+        campo.agregar_estacion(Estacion(f"e{numero}", f"Estación {numero}"))
+    suelo = SensorSuelo("s1", "Suelo")
+    suelo.agregar_frecuencias(["e1", "e2", "e4"], [10, 5, 3])
+    campo.agregar_sensor_suelo(suelo)
+    cultivo = SensorCultivo("t1", "Cultivo")
+    cultivo.agregar_frecuencias(["e2", "e3"], [7, 1])
+    campo.agregar_sensor_cultivo(cultivo)
+    return campo
+
+
+def patrones(campo):
+    return [(estacion.id, estacion.patron_suelo.bits, estacion.patron_suelo.longitud,
+             estacion.patron_cultivo.bits, estacion.patron_cultivo.longitud)
+            for estacion in campo.estaciones]
+
+
+def grupos(campo):
+    return [([estacion.id for estacion in grupo], sorted((sensor.id, total) for sensor, total
+                                                        in grupo.frecuencias_totales.items() if total))
+            for grupo in campo.grupos_estaciones]
+
+
+class TestReprocesarCampo(unittest.TestCase):
+
+    def setUp(self):
+        Bitacora.establecer_nivel(0)
+
+    def comparar_con_calculo_completo(self, campo):
+        incremental = (patrones(campo), grupos(campo))
+        calcular_campo(campo, "hash")
+        self.assertEqual(incremental, (patrones(campo), grupos(campo)))
+
+    def test_estacion_con_id_repetido_recibe_patrones(self):
+        campo = crear_campo()
+        reprocesar_campo(campo)
+
+        repetida = Estacion("e2", "Repetida")
+        campo.insertar_estacion(repetida)
+        reprocesar_campo(campo)
+        self.assertIsNotNone(repetida.patron_suelo)
+        self.assertIsNotNone(repetida.patron_cultivo)
+        self.comparar_con_calculo_completo(campo)
+
+    def test_cambio_en_id_repetido_actualiza_todas_sus_estaciones(self):
+        campo = crear_campo()
+        reprocesar_campo(campo)
+        campo.insertar_estacion(Estacion("e3", "Repetida"))
+        reprocesar_campo(campo)
+
+        campo.actualizar_frecuencia("s1", "e3", 8)
+        reprocesar_campo(campo)
+        self.comparar_con_calculo_completo(campo)
+
+    def test_motor_no_incremental_se_rechaza(self):
+        with self.assertRaises(ValueError):
+            reprocesar_campo(crear_campo(), "tolerancia", distancia_maxima=1)
+        with self.assertRaises(ValueError):
+            reprocesar_campo(crear_campo(), "inexistente")
+
+    def test_tolerancia_sin_distancia_es_exacta(self):
+        campo = crear_campo()
+        reprocesar_campo(campo, "tolerancia", distancia_maxima=0)
+        campo.insertar_estacion(Estacion("e5", "Nueva"))
+        campo.actualizar_frecuencia("t1", "e5", 2, "cultivo")
+        reprocesar_campo(campo, "tolerancia", distancia_maxima=0)
+        self.comparar_con_calculo_completo(campo)
+
+
+if __name__ == "__main__":
+    unittest.main()